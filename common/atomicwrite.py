@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+"""
+Atomic file writes: the content is written to a temporary file in the
+same directory, which replaces the file once it is complete. Readers
+never see a partial file, and a failure leaves the original file as it
+was.
+"""
+
+import filecmp
+import io
+import os
+import tempfile
+
+def atomicWrite(filename, write, binary=False, only_if_changed=False):
+    """
+    Write a file atomically. write is called with the temporary file,
+    opened in binary mode or else as UTF-8 text with Unix line endings.
+    The file keeps its permissions (a new file gets those of open).
+
+    With only_if_changed, a file with the same content is left as it is
+    (it keeps its modification time). Return True if the file was written
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(filename) + '.')
+    try:
+        if binary:
+            f = io.open(fd, 'wb')
+        else:
+            f = io.open(fd, 'w', encoding='utf-8', newline='\n')
+        with f:
+            write(f)
+
+        if only_if_changed and os.path.isfile(filename) and filecmp.cmp(tmp, filename, shallow=False):
+            os.remove(tmp)
+            return False
+
+        # mkstemp creates the file readable by its owner only
+        if os.path.exists(filename):
+            mode = os.stat(filename).st_mode & 0o7777
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp, mode)
+
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return True
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Throughput benchmark for the sexpr module.
+
+The tokenizer is compared against the original (groupdict based)
+implementation. Files can be passed on the command line, otherwise a
+synthetic footprint is generated.
+
+    ./benchmark_sexpr.py
+    ./benchmark_sexpr.py `find /usr/share/kicad/footprints -name *.kicad_mod`
+
+With --board-mb, a synthetic .kicad_pcb of that size is written and the
+peak memory (RSS) of parsing it is measured, for the text path used
+before (readlines + parse_sexp) and for parse_sexp_file (mmap):
+
+    ./benchmark_sexpr.py --board-mb 50
+"""
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import sexpr
+
+def legacy_parse_sexp(sexp):
+    # parse_sexp as it was before the lastgroup based tokenizer
+    stack = []
+    out = []
+    for termtypes in re.finditer(sexpr.term_regex, sexp):
+        term, value = [(t,v) for t,v in termtypes.groupdict().items() if v][0]
+        if   term == 'brackl':
+            stack.append(out)
+            out = []
+        elif term == 'brackr':
+            assert stack, "Trouble with nesting of brackets"
+            tmpout, out = out, stack.pop(-1)
+            out.append(tmpout)
+        elif term == 'num':
+            v = float(value)
+            if v.is_integer(): v = int(v)
+            out.append(v)
+        elif term == 'sq':
+            out.append(value[1:-1].replace(r'\"', '"'))
+        elif term == 's':
+            out.append(value)
+        else:
+            raise NotImplementedError("Error: %r" % (term, value))
+    assert not stack, "Trouble with nesting of brackets"
+    return out[0]
+
+def synthetic_footprint(n_pads, seed=0):
+    """
+    Generate a .kicad_mod-like footprint with n_pads pads
+    """
+    rnd = random.Random(seed)
+    lines = ['(module Synthetic_{n} (layer F.Cu) (tedit 5A1D4F2C)'.format(n=n_pads),
+             '  (descr "synthetic footprint with {n} pads")'.format(n=n_pads),
+             '  (tags "synthetic benchmark")',
+             '  (attr smd)',
+             '  (fp_text reference REF** (at 0 -3.5) (layer F.SilkS)',
+             '    (effects (font (size 1 1) (thickness 0.15)))',
+             '  )',
+             '  (fp_text value Synthetic (at 0 3.5) (layer F.Fab)',
+             '    (effects (font (size 1 1) (thickness 0.15)))',
+             '  )']
+    for i in range(n_pads // 4 + 1):
+        lines.append('  (fp_line (start {0:.2f} {1:.2f}) (end {2:.2f} {3:.2f}) (layer F.SilkS) (width 0.12))'.format(
+            rnd.uniform(-10, 10), rnd.uniform(-10, 10), rnd.uniform(-10, 10), rnd.uniform(-10, 10)))
+    for i in range(n_pads):
+        lines.append('  (pad {n} smd rect (at {x:.3f} {y:.3f}) (size 0.6 1.2) (layers F.Cu F.Paste F.Mask))'.format(
+            n=i + 1, x=rnd.uniform(-10, 10), y=rnd.uniform(-10, 10)))
+    lines.append('  (model ${KISYS3DMOD}/Synthetic.3dshapes/Synthetic.wrl')
+    lines.append('    (at (xyz 0 0 0))')
+    lines.append('    (scale (xyz 1 1 1))')
+    lines.append('    (rotate (xyz 0 0 0))')
+    lines.append('  )')
+    lines.append(')')
+    return '\n'.join(lines) + '\n'
+
+def write_synthetic_board(filename, size_mb, seed=0):
+    """
+    Write a .kicad_pcb-like board of about size_mb megabytes
+    """
+    rnd = random.Random(seed)
+    size = size_mb * 1e6
+    with open(filename, 'w') as f:
+        f.write('(kicad_pcb (version 20171130) (host pcbnew 5.0.0)\n')
+        f.write('  (general (thickness 1.6) (drawings 0) (tracks 0) (zones 0) (modules 0) (nets 2))\n')
+        f.write('  (net 0 "")\n  (net 1 "Net-(R1-Pad1)")\n')
+        written = 0
+        while written < size:
+            block = []
+            for i in range(1000):
+                block.append('  (segment (start {0:.4f} {1:.4f}) (end {2:.4f} {3:.4f}) (width 0.25) (layer F.Cu) (net 1) (tstamp 5A1D4F2C))\n'.format(
+                    rnd.uniform(0, 300), rnd.uniform(0, 200), rnd.uniform(0, 300), rnd.uniform(0, 200)))
+                block.append('  (via (at {0:.4f} {1:.4f}) (size 0.8) (drill 0.4) (layers F.Cu B.Cu) (net 1))\n'.format(
+                    rnd.uniform(0, 300), rnd.uniform(0, 200)))
+            block = ''.join(block)
+            f.write(block)
+            written += len(block)
+        f.write(')\n')
+
+# Parse a file in a separate process and print its peak RSS (in kB)
+_RSS_SCRIPT = """
+import resource, sys
+sys.path.insert(0, {common!r})
+import sexpr
+if {legacy!r}:
+    f = open({filename!r})
+    tree = sexpr.parse_sexp(''.join(f.readlines()))
+    f.close()
+else:
+    tree = sexpr.parse_sexp_file({filename!r})
+print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def peak_rss(filename, legacy):
+    script = _RSS_SCRIPT.format(common=os.path.dirname(os.path.abspath(__file__)), filename=filename, legacy=legacy)
+    env = dict(os.environ)
+    env.pop('KICAD_UTILS_CACHE_DIR', None)
+    out = subprocess.check_output([sys.executable, '-c', script], env=env)
+    return int(out.decode().strip())
+
+def count_tokens(sexp):
+    return sum(1 for _ in sexpr._token_re.finditer(sexp))
+
+def bench(name, func, data, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        for d in data:
+            func(d)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the s-expression tokenizer')
+    parser.add_argument('files', nargs='*', help='s-expression files to parse (default: synthetic footprint)')
+    parser.add_argument('--pads', help='number of pads in the synthetic footprint', type=int, default=2000)
+    parser.add_argument('--repeat', help='number of runs (best is reported)', type=int, default=5)
+    parser.add_argument('--board-mb', help='measure peak RSS when parsing a synthetic board of this size (MB)', type=int)
+    args = parser.parse_args()
+
+    if args.board_mb:
+        fd, board = tempfile.mkstemp(suffix='.kicad_pcb')
+        os.close(fd)
+        try:
+            write_synthetic_board(board, args.board_mb)
+            print("board: {mb:.1f} MB".format(mb=os.path.getsize(board) / 1e6))
+            print("readlines + parse_sexp:  peak RSS {kb:8d} kB".format(kb=peak_rss(board, True)))
+            print("parse_sexp_file (mmap):  peak RSS {kb:8d} kB".format(kb=peak_rss(board, False)))
+        finally:
+            os.remove(board)
+        sys.exit(0)
+
+    if args.files:
+        data = []
+        for filename in args.files:
+            with open(filename) as f:
+                data.append(f.read())
+    else:
+        data = [synthetic_footprint(args.pads)]
+
+    size_mb = sum(len(d.encode('utf-8')) for d in data) / 1e6
+    tokens = sum(count_tokens(d) for d in data)
+
+    for d in data:
+        if sexpr.parse_sexp(d) != legacy_parse_sexp(d):
+            print("Parsed trees differ from the legacy implementation!")
+
+    print("{n} file(s), {mb:.2f} MB, {t} tokens".format(n=len(data), mb=size_mb, t=tokens))
+
+    for name, func in [('legacy', legacy_parse_sexp), ('parse_sexp', sexpr.parse_sexp)]:
+        elapsed = bench(name, func, data, args.repeat)
+        print("{name:<12} {s:8.3f} s {tps:12.0f} tokens/s {mbs:8.2f} MB/s".format(
+            name=name, s=elapsed, tps=tokens / elapsed, mbs=size_mb / elapsed))
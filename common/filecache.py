@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""
+Persistent on-disk cache for data derived from library files (parsed
+s-expressions, parsed symbol libraries, ...).
+
+Entries are keyed on the content hash of the source files. Computing that
+hash needs the whole file, so the hash is remembered together with the
+path, size and modification time of the file: as long as these do not
+change the file is not read again.
+
+The cache directory has a size cap; when it is exceeded the least recently
+used entries are removed.
+
+The cache is opt-in. Tools enable it with a --cache-dir argument or with
+the KICAD_UTILS_CACHE_DIR environment variable.
+"""
+
+import hashlib
+import marshal
+import os
+import sys
+import time
+
+from atomicwrite import atomicWrite
+
+CACHE_DIR_ENV = 'KICAD_UTILS_CACHE_DIR'
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+def defaultCacheDir():
+    return os.environ.get(CACHE_DIR_ENV) or None
+
+def _hashFile(filename):
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+class FileCache(object):
+    """
+    A directory of serialized values, keyed on the content of source files
+
+    version must change whenever the format of the cached values changes
+    (e.g. a new parser version). dumps/loads serialize the values, marshal
+    is used by default.
+    """
+
+    # Files modified less than this many seconds ago might still be
+    # modified within the same mtime tick, so their hash is not remembered
+    RACY_SECONDS = 2
+
+    def __init__(self, directory, version, max_size=DEFAULT_MAX_SIZE, dumps=marshal.dumps, loads=marshal.loads):
+        self.directory = directory
+        self.version = '{v}-py{major}.{minor}'.format(v=version, major=sys.version_info[0], minor=sys.version_info[1])
+        self.max_size = max_size
+        self.dumps = dumps
+        self.loads = loads
+
+        # total size of the cache directory, computed on first write
+        self._size = None
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, prefix, name):
+        return os.path.join(self.directory, prefix + '-' + name)
+
+    def _write(self, path, data):
+        # write to a temporary file and rename it, so that concurrent
+        # readers (e.g. parallel workers) never see a partial entry
+        try:
+            atomicWrite(path, lambda f: f.write(data), binary=True)
+        except OSError:
+            return
+
+        if self._size is None:
+            self._size = self._directorySize()
+        else:
+            self._size += len(data)
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def _directorySize(self):
+        size = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                size += entry.stat().st_size
+        return size
+
+    def fileHash(self, filename):
+        """
+        Return the content hash of a file, reading the file only if its
+        path, size or modification time changed since it was last hashed
+        """
+        st = os.stat(filename)
+        stamp = '{size} {mtime}'.format(size=st.st_size, mtime=st.st_mtime_ns)
+        path = self._path('stat', hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest())
+
+        try:
+            with open(path, 'r') as f:
+                cached_stamp, digest = f.read().rsplit(' ', 1)
+            if cached_stamp == stamp:
+                return digest
+        except (OSError, ValueError):
+            pass
+
+        digest = _hashFile(filename)
+
+        if time.time() - st.st_mtime > self.RACY_SECONDS:
+            self._write(path, '{stamp} {digest}'.format(stamp=stamp, digest=digest).encode('utf-8'))
+
+        return digest
+
+    def key(self, filenames):
+        """
+        Return the cache key of the values derived from the given files
+        (missing files are part of the key as well)
+        """
+        sha = hashlib.sha1(self.version.encode('utf-8'))
+        for filename in filenames:
+            if os.path.isfile(filename):
+                sha.update(self.fileHash(filename).encode('utf-8'))
+            else:
+                sha.update(b'-')
+        return sha.hexdigest()
+
+    def get(self, key):
+        """
+        Return the value stored for key, or None
+        """
+        path = self._path('data', key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        # a corrupt or outdated entry is a miss
+        try:
+            value = self.loads(data)
+        except Exception:
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return value
+
+    def put(self, key, value):
+        data = self.dumps(value)
+
+        # an entry which does not fit would only evict everything else
+        if len(data) > self.max_size * 0.9:
+            return
+
+        self._write(self._path('data', key), data)
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache uses less
+        than 90% of max_size
+        """
+        entries = []
+        size = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                size += st.st_size
+
+        entries.sort()
+        limit = self.max_size * 0.9
+        for mtime, entry_size, path in entries:
+            if size <= limit:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+            except OSError:
+                pass
+
+        self._size = size
@@ -3,43 +3,84 @@
 import inspect, os, sys
 import json
 
-def logError(log_file, rule_name, lib_name, item_name, warning=False):
-    """
-    Log KLC error output to a json file.
-    The JSON file will contain a cumulative dict
-    of the errors and the library items that do not comply.
+class ErrorLog(object):
     """
+    Collect the KLC violations of a run and log them to a json file.
+
+    The JSON file contains a cumulative dict of the errors (and warnings)
+    and the library items that do not comply, the entries are added to
+    those already in the file. In the 'jsonl' format, one JSON object is
+    appended per entry instead (JSON Lines), so that several processes can
+    log to the same file.
 
-    if not log_file.endswith('.json'):
-        log_file += '.json'
+    Nothing is written until flush is called.
+    """
 
-    if os.path.exists(log_file) and os.path.isfile(log_file):
-        with open(log_file, 'r') as json_file:
+    def __init__(self, log_file, format='json'):
+        # a JSON Lines log keeps the extension it was given (e.g. errors.json)
+        if format == 'json':
+            if not log_file.endswith('.json'):
+                log_file += '.json'
+        elif not os.path.splitext(log_file)[1]:
+            log_file += '.' + format
+
+        self.log_file = log_file
+        self.format = format
+        self.entries = []
+
+    def logError(self, rule_name, lib_name, item_name, warning=False):
+        self.entries.append((rule_name, lib_name, item_name, warning))
+
+    def flush(self):
+        """
+        Write the collected entries to the log file
+        """
+        if not self.entries:
+            return
+
+        if self.format == 'jsonl':
+            lines = []
+            for rule_name, lib_name, item_name, warning in self.entries:
+                entry = {'type': 'warning' if warning else 'error', 'rule': rule_name, 'library': lib_name, 'item': item_name}
+                lines.append(json.dumps(entry, sort_keys=True) + '\n')
+
+            # a single write in append mode, the lines of concurrent
+            # processes are not interleaved
+            data = ''.join(lines).encode('utf-8')
+            fd = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
             try:
-                log_data = json.loads(json_file.read())
-            except:
-                print("Found bad JSON data - clearing")
-                log_data = {}
+                while data:
+                    data = data[os.write(fd, data):]
+            finally:
+                os.close(fd)
+        else:
+            self.__writeJson()
 
-    else:
-        log_data = {}
+        self.entries = []
 
-    key = 'warnings' if warning else 'errors'
+    def __writeJson(self):
+        if os.path.exists(self.log_file) and os.path.isfile(self.log_file):
+            with open(self.log_file, 'r') as json_file:
+                try:
+                    log_data = json.loads(json_file.read())
+                except:
+                    print("Found bad JSON data - clearing")
+                    log_data = {}
 
-    if not key in log_data:
-        log_data[key] = {}
+        else:
+            log_data = {}
 
-    log_entry = {'library': lib_name, 'item': item_name}
+        for rule_name, lib_name, item_name, warning in self.entries:
+            key = 'warnings' if warning else 'errors'
 
-    if not rule_name in log_data[key]:
-        log_data[key][rule_name] = []
+            log_entry = {'library': lib_name, 'item': item_name}
 
-    log_data[key][rule_name].append(log_entry)
+            log_data.setdefault(key, {}).setdefault(rule_name, []).append(log_entry)
 
-    # Write the log data back to file
-    with open(log_file, 'w') as json_file:
-        op = json.dumps(log_data, indent=4, sort_keys=True, separators=(',', ':'))
-        json_file.write(op)
+        # Write the log data back to file
+        with open(self.log_file, 'w') as json_file:
+            op = json.dumps(log_data, indent=4, sort_keys=True, separators=(',', ':'))
+            json_file.write(op)
 
 # Static functions
 def isValidName(name, checkForGraphicSymbol=False, checkForPowerSymbol=False):
@@ -68,18 +109,13 @@ def isValidName(name, checkForGraphicSymbol=False, checkForPowerSymbol=False):
 
 def checkLineEndings(filename):
     """
-    Check for proper (Unix) line endings
+    Check for proper (Unix) line endings in the whole file
     """
-    filecontentsraw = open(filename, 'rb').readline()
-
-    LE1 = ord(chr(filecontentsraw[-2]))
-    LE2 = ord(chr(filecontentsraw[-1]))
-
-    # 0x0D0A = Windows (CRLF)
-    # 0x__0D = Mac OS 9 (CR)
-    # 0x__0A = Unix (LF)
-    if (LE1 == 0x0D and LE2 == 0x0A) or (LE2 == 0x0D):
-        return False
+    with open(filename, 'rb') as f:
+        # CR+LF (Windows) and CR (Mac OS 9) line endings both contain a CR
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            if b'\r' in block:
+                return False
 
     return True
 
@@ -94,6 +130,10 @@ class Severity:
     ERROR=2
     SUCCESS=3
 
+class Scope:
+    ITEM=0
+    LIBRARY=1
+
 class KLCRuleBase(object):
     """
     A base class to represent a KLC rule
@@ -101,6 +141,10 @@ class KLCRuleBase(object):
 
     verbosity = 0
 
+    # rules of the LIBRARY scope are checked once per library file, the
+    # others once per item (symbol, footprint) of the library
+    scope = Scope.ITEM
+
     @property
     def name(self):
         path = inspect.getfile(self.__class__)
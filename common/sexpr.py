@@ -3,10 +3,20 @@
 
 from __future__ import print_function
 import re
+import os
+import mmap
+
+from filecache import FileCache, defaultCacheDir
 
 dbg = False
 float_render = "%.2f"
 
+# Bump when parse_sexp output changes, to invalidate cached trees
+PARSER_VERSION = 1
+
+# On-disk cache of parsed files (see enable_cache)
+_cache = None
+
 term_regex = r'''(?mx)
     \s*(?:
         (?P<brackl>\()|
@@ -16,33 +26,348 @@ term_regex = r'''(?mx)
         (?P<s>[^(^)\s]+)
        )'''
 
+# Same token grammar as term_regex, but without the inner capture group so
+# that match.lastgroup always names the token type
+_token_re = re.compile(r'''(?mx)
+    \s*(?:
+        (?P<brackl>\()|
+        (?P<brackr>\))|
+        (?P<num>[+-]?\d+\.\d+(?=[\ \)])|\-?\d+(?=[\ \)]))|
+        (?P<sq>"(?:[^"]|(?<=\\)")*")|
+        (?P<s>[^(^)\s]+)
+       )''')
+
+def _parse_num(value):
+    # Integers are converted directly; they only go through float() when they
+    # are too long to be represented exactly (same result as float() before)
+    if '.' not in value:
+        if len(value) < 16:
+            return int(value)
+        return int(float(value))
+    v = float(value)
+    if v.is_integer(): v = int(v)
+    return v
+
 def parse_sexp(sexp):
     stack = []
     out = []
+    append = out.append
     if dbg: print("%-6s %-14s %-44s %-s" % tuple("term value out stack".split()))
-    for termtypes in re.finditer(term_regex, sexp):
-        term, value = [(t,v) for t,v in termtypes.groupdict().items() if v][0]
-        if dbg: print("%-7s %-14s %-44r %-r" % (term, value, out, stack))
-        if   term == 'brackl':
+    for match in _token_re.finditer(sexp):
+        term = match.lastgroup
+        if dbg: print("%-7s %-14s %-44r %-r" % (term, match.group(term), out, stack))
+        if   term == 's':
+            append(match.group(term))
+        elif term == 'brackl':
             stack.append(out)
             out = []
+            append = out.append
         elif term == 'brackr':
             assert stack, "Trouble with nesting of brackets"
-            tmpout, out = out, stack.pop(-1)
-            out.append(tmpout)
+            tmpout, out = out, stack.pop()
+            append = out.append
+            append(tmpout)
+        elif term == 'num':
+            append(_parse_num(match.group(term)))
+        elif term == 'sq':
+            append(match.group(term)[1:-1].replace(r'\"', '"'))
+        else:
+            raise NotImplementedError("Error: %r" % (term, ))
+    assert not stack, "Trouble with nesting of brackets"
+    return out[0]
+
+# term_regex for bytes buffers (whitespace and digits are ASCII only)
+_token_re_bytes = re.compile(_token_re.pattern.encode('ascii'))
+
+def _parse_num_bytes(value):
+    if b'.' not in value:
+        if len(value) < 16:
+            return int(value)
+        return int(float(value))
+    v = float(value)
+    if v.is_integer(): v = int(v)
+    return v
+
+def _decode(value):
+    value = value.decode('utf-8')
+    # same newlines as a file read in text mode
+    if '\r' in value:
+        value = value.replace('\r\n', '\n').replace('\r', '\n')
+    return value
+
+def parse_sexp_bytes(buf):
+    """
+    parse_sexp for a bytes-like object or an mmap with UTF-8 content.
+
+    The buffer is tokenized as is, only atoms are decoded, so no decoded
+    copy of the whole content is made.
+    """
+    stack = []
+    out = []
+    append = out.append
+    # decoded symbols, most of them ('at', 'layer', 'F.Cu', ...) repeat a lot
+    symbols = {}
+    for match in _token_re_bytes.finditer(buf):
+        term = match.lastgroup
+        if   term == 's':
+            value = match.group(term)
+            symbol = symbols.get(value)
+            if symbol is None:
+                symbol = symbols[value] = _decode(value)
+            append(symbol)
+        elif term == 'brackl':
+            stack.append(out)
+            out = []
+            append = out.append
+        elif term == 'brackr':
+            assert stack, "Trouble with nesting of brackets"
+            tmpout, out = out, stack.pop()
+            append = out.append
+            append(tmpout)
         elif term == 'num':
-            v = float(value)
-            if v.is_integer(): v = int(v)
-            out.append(v)
+            append(_parse_num_bytes(match.group(term)))
         elif term == 'sq':
-            out.append(value[1:-1].replace(r'\"', '"'))
-        elif term == 's':
+            append(_decode(match.group(term)[1:-1]).replace(r'\"', '"'))
+        else:
+            raise NotImplementedError("Error: %r" % (term, ))
+    assert not stack, "Trouble with nesting of brackets"
+    return out[0]
+
+def _parse_file(filename):
+    # memory-map the file, so that its content is never copied
+    with open(filename, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can not be mapped
+            return parse_sexp_bytes(f.read())
+        try:
+            return parse_sexp_bytes(buf)
+        finally:
+            buf.close()
+
+class SexprNode(tuple):
+    """
+    List of a compact tree (see compact_tree). It is an immutable tuple,
+    with the first element also available as head.
+    """
+    __slots__ = ()
+
+    @property
+    def head(self):
+        return self[0] if self else None
+
+# Atoms of all compact trees: equal symbols, strings and numbers are stored
+# once. Integral numbers are always parsed as int, so an int never equals a
+# float here and they can share the same table.
+_atoms = {}
+
+def compact_tree(tree):
+    """
+    Return a compact copy of a parsed tree: lists become SexprNode tuples
+    (no over-allocation) and atoms are shared with all other compact trees.
+    Useful when many files are kept in memory at once.
+    """
+    atoms = _atoms
+
+    def compact(data):
+        items = []
+        for i in data:
+            if type(i) == list:
+                items.append(compact(i))
+            else:
+                items.append(atoms.setdefault(i, i))
+        return SexprNode(items)
+
+    return compact(tree)
+
+def enable_cache(directory, max_size=None):
+    """
+    Cache the trees returned by parse_sexp_file in directory, so that
+    unchanged files are not tokenized again in later runs
+    """
+    global _cache
+    directory = os.path.join(directory, 'sexpr')
+    if max_size is None:
+        _cache = FileCache(directory, PARSER_VERSION)
+    else:
+        _cache = FileCache(directory, PARSER_VERSION, max_size=max_size)
+
+def disable_cache():
+    global _cache
+    _cache = None
+
+def parse_sexp_file(filename, compact=False):
+    """
+    Parse the content of a file, using the on-disk cache if enabled.
+    With compact=True the tree is returned as by compact_tree.
+    """
+    tree = None
+
+    if _cache is not None:
+        key = _cache.key([filename])
+        tree = _cache.get(key)
+
+    if tree is None:
+        tree = _parse_file(filename)
+
+        if _cache is not None:
+            _cache.put(key, tree)
+
+    if compact:
+        tree = compact_tree(tree)
+
+    return tree
+
+if defaultCacheDir():
+    enable_cache(defaultCacheDir())
+
+# Size of the blocks read from file objects by the streaming API
+stream_chunk_size = 64 * 1024
+
+def _atom(term, value):
+    if term == 'num':
+        return _parse_num(value)
+    elif term == 'sq':
+        return value[1:-1].replace(r'\"', '"')
+    return value
+
+def _iter_tokens(source):
+    """
+    Yield (term, value) pairs from a string or a readable file object.
+
+    File objects are read in blocks of stream_chunk_size. A token is only
+    emitted once the data following it is known, so the result is the same
+    as tokenizing the whole content at once.
+    """
+    if not hasattr(source, 'read'):
+        for match in _token_re.finditer(source):
+            term = match.lastgroup
+            yield term, match.group(term)
+        return
+
+    buf = ''
+    final = False
+    while not final:
+        chunk = source.read(stream_chunk_size)
+        if chunk:
+            buf += chunk
+            # tokens which end before the last newline can not change
+            safe = buf.rfind('\n') + 1
+        else:
+            final = True
+            safe = len(buf)
+
+        pos = 0
+        for match in _token_re.finditer(buf):
+            term = match.lastgroup
+            value = match.group(term)
+            if not final:
+                # a token touching the end of the block (or a quoted string
+                # that may continue in the next block) has to wait for more data
+                if (match.end() > safe or
+                    (term == 's' and value.startswith('"')) or
+                    (term == 'sq' and value.endswith('\\"'))):
+                    break
+            pos = match.end()
+            yield term, value
+        buf = buf[pos:]
+
+def iter_events(source):
+    """
+    Parse s-expression data incrementally, without building the tree.
+
+    source can be a string or a readable file object. Yields (event, value)
+    tuples, where event is one of:
+      'start' - an opening bracket (value is None)
+      'end'   - a closing bracket (value is None)
+      'atom'  - a number, quoted or unquoted string (value as in parse_sexp)
+
+    The data is only read as far as the consumer iterates.
+    """
+    depth = 0
+    for term, value in _iter_tokens(source):
+        if term == 'brackl':
+            depth += 1
+            yield 'start', None
+        elif term == 'brackr':
+            assert depth, "Trouble with nesting of brackets"
+            depth -= 1
+            yield 'end', None
+        else:
+            yield 'atom', _atom(term, value)
+
+def iter_subtrees(source, head, max_count=None):
+    """
+    Yield only the subtrees whose first element is head (e.g. 'pad' or
+    'model'), each one built as parse_sexp would build it. Subtrees nested
+    in a matching subtree are part of it and not yielded separately.
+
+    Nothing else is materialized. Parsing stops after max_count subtrees
+    (if given) or as soon as the consumer stops iterating.
+    """
+    count = 0
+    # enclosing lists of the subtree being built
+    stack = []
+    out = None
+    # a bracket was just opened and its head has not been seen yet
+    pending = False
+
+    for event, value in iter_events(source):
+        if event == 'start':
+            if out is not None:
+                stack.append(out)
+                out = []
+            else:
+                pending = True
+        elif event == 'end':
+            pending = False
+            if out is None:
+                continue
+            elif stack:
+                tmpout, out = out, stack.pop()
+                out.append(tmpout)
+            else:
+                tree, out = out, None
+                yield tree
+                count += 1
+                if max_count is not None and count >= max_count:
+                    return
+        elif out is not None:
             out.append(value)
+        elif pending:
+            pending = False
+            if value == head:
+                out = [value]
+
+def parse_sexp_head(source, stop):
+    """
+    Build the tree like parse_sexp, but only up to the first child of the
+    root list whose head is in stop (e.g. the first pad of a footprint).
+    That child and everything after it is neither parsed nor read.
+    """
+    stack = []
+    out = []
+    # a child of the root list was just opened and its head not seen yet
+    pending = False
+
+    for event, value in iter_events(source):
+        if event == 'start':
+            stack.append(out)
+            out = []
+            pending = len(stack) == 2
+        elif event == 'end':
+            pending = False
+            tmpout, out = out, stack.pop()
+            out.append(tmpout)
         else:
-            raise NotImplementedError("Error: %r" % (term, value))
+            if pending and value in stop:
+                return stack[1]
+            pending = False
+            out.append(value)
     assert not stack, "Trouble with nesting of brackets"
     return out[0]
-    
+
 # Form a valid sexpr (single line)
 def SexprItem(val, key=None):
     if key:
@@ -73,23 +398,36 @@ def SexprItem(val, key=None):
     return fmt.format(val=val)
     
 class SexprBuilder(object):
-    def __init__(self, key):
+    """
+    Build a formatted s-expression piece by piece.
+
+    The output is collected as a list of chunks (see the output property),
+    or written directly to stream if one is given.
+    """
+    def __init__(self, key, stream=None):
         self.indent = 0
-        self.output = ''
+        self.stream = stream
+        self.chunks = []
+        self._write = self.chunks.append if stream is None else stream.write
         self.items = []
         if key is not None:
             self.startGroup(key, newline=False)
-       
+
+    @property
+    def output(self):
+        return ''.join(self.chunks)
+
     def _indent(self):
-        self.output += ' ' * 2 * self.indent
-   
+        self._write(' ' * 2 * self.indent)
+
     def _newline(self):
-        self.output += '\n'
-        
+        self._write('\n')
+
     def _addItems(self):
-        self.output += ' '.join(map(str,self.items))
-        self.items = []
-       
+        if self.items:
+            self._write(' '.join(map(str,self.items)))
+            self.items = []
+
     def startGroup(self, key=None, newline=True, indent=False):
         self._addItems()
         if newline and indent:
@@ -97,9 +435,9 @@ class SexprBuilder(object):
         if newline:
             self._newline()
             self._indent()
-        self.output += '('
+        self._write('(')
         if key:
-            self.output += str(key) + ' '
+            self._write(str(key) + ' ')
             
     def endGroup(self, newline=True):
         self._addItems()
@@ -108,7 +446,7 @@ class SexprBuilder(object):
             if self.indent > 0:
                 self.indent -= 1
             self._indent()
-        self.output += ')'
+        self._write(')')
         
     def addOptItem(self, key, item, newline=True, indent=False):
         if item in [None, 0, False]:
@@ -170,36 +508,58 @@ def build_sexp(exp, key=None):
         
     return out
 
-def format_sexp(sexp, indentation_size=2, max_nesting=2):
-    out = ''
+def _format_tokens(tokens, indentation_size, max_nesting):
+    # yield the pieces of the formatted output, see format_sexp
     n = 0
-    for termtypes in re.finditer(term_regex, sexp):
-        indentation = ''
-        term, value = [(t,v) for t,v in termtypes.groupdict().items() if v][0]
+    # last character written
+    last = ''
+    # an atom has been written and is waiting for its separating space
+    space = False
+
+    for term, value in tokens:
         if term == 'brackl':
-            if out:
+            if last:
                 if n <= max_nesting:
-                    if out[-1] == ' ': out = out[:-1]
-                    indentation = '\n' + (' ' * indentation_size * n)
-                else:
-                    if out[-1] == ')': out += ' '
+                    yield '\n' + (' ' * indentation_size * n)
+                elif space or last == ')':
+                    yield ' '
+            space = False
+            yield value
             n += 1
         elif term == 'brackr':
-            if out and out[-1] == ' ': out = out[:-1]
+            space = False
+            yield value
             n -= 1
-        elif term == 'num':
-            value += ' '
-        elif term == 'sq':
-            value += ' '
-        elif term == 's':
-            value += ' '
+        elif term in ('num', 'sq', 's'):
+            if space:
+                yield ' '
+            yield value
+            space = True
         else:
             raise NotImplementedError("Error: %r" % (term, value))
+        last = value[-1]
 
-        out += indentation + value
+    if space:
+        yield ' '
+    yield '\n'
 
-    out += '\n'
-    return out
+def format_sexp(sexp, indentation_size=2, max_nesting=2):
+    """
+    Reformat s-expression text: each list nested up to max_nesting levels
+    starts on a new line, indented by indentation_size per level; deeper
+    lists stay on the line of their parent.
+    """
+    return ''.join(_format_tokens(_iter_tokens(sexp), indentation_size, max_nesting))
+
+def format_sexp_file(source, dest, indentation_size=2, max_nesting=2):
+    """
+    Same as format_sexp, reading from the file object source and writing
+    to the file object dest as it goes, so files of any size can be
+    reformatted in constant memory.
+    """
+    write = dest.write
+    for piece in _format_tokens(_iter_tokens(source), indentation_size, max_nesting):
+        write(piece)
 
 if __name__ == '__main__':
     sexp = ''' ( ( data "quoted data" 123 4.5)
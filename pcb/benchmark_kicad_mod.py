@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark for saving footprints with the KicadMod class.
+
+A synthetic footprint with many pads is loaded and saved, once with the
+original string-concatenating SexprBuilder and once with the current one.
+
+    ./benchmark_kicad_mod.py --pads 10000
+
+With --footprints, that many small synthetic footprints are loaded and
+kept in memory, and the memory used per footprint is reported for the
+normal and the compact (sexpr.compact_tree) representation:
+
+    ./benchmark_kicad_mod.py --footprints 2000
+"""
+
+from __future__ import print_function
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+common = os.path.abspath(os.path.join(sys.path[0], '..','common'))
+
+if not common in sys.path:
+    sys.path.append(common)
+
+import sexpr
+from kicad_mod import KicadMod
+from benchmark_sexpr import synthetic_footprint
+
+class LegacySexprBuilder(object):
+    """
+    SexprBuilder as it was before the chunk list: every token is
+    appended to a single string
+    """
+
+    # last created builder, to get the output back from KicadMod._save
+    last = None
+
+    def __init__(self, key, stream=None):
+        LegacySexprBuilder.last = self
+        self.indent = 0
+        self.output = ''
+        self.items = []
+        if key is not None:
+            self.startGroup(key, newline=False)
+
+    def _indent(self):
+        self.output += ' ' * 2 * self.indent
+
+    def _newline(self):
+        self.output += '\n'
+
+    def _addItems(self):
+        self.output += ' '.join(map(str,self.items))
+        self.items = []
+
+    def startGroup(self, key=None, newline=True, indent=False):
+        self._addItems()
+        if newline and indent:
+            self.indent += 1
+        if newline:
+            self._newline()
+            self._indent()
+        self.output += '('
+        if key:
+            self.output += str(key) + ' '
+
+    def endGroup(self, newline=True):
+        self._addItems()
+        if newline:
+            self._newline()
+            if self.indent > 0:
+                self.indent -= 1
+            self._indent()
+        self.output += ')'
+
+    addOptItem = sexpr.SexprBuilder.addOptItem
+    addItem = sexpr.SexprBuilder.addItem
+    addItems = sexpr.SexprBuilder.addItems
+    newLine = sexpr.SexprBuilder.newLine
+    unIndent = sexpr.SexprBuilder.unIndent
+
+def legacy_save(module, filename):
+    builder = sexpr.SexprBuilder
+    sexpr.SexprBuilder = LegacySexprBuilder
+    try:
+        # build the whole string first, then write it, as before
+        module._save(io.StringIO())
+        with open(filename, 'w', newline='\n') as f:
+            f.write(LegacySexprBuilder.last.output)
+            f.write('\n')
+    finally:
+        sexpr.SexprBuilder = builder
+
+def bench(func, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def bytes_per_footprint(load, filenames):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    loaded = [load(filename) for filename in filenames]
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return used / len(loaded)
+
+def load_module(filename, compact):
+    module = KicadMod(filename, compact=compact)
+    module.pads
+    return module
+
+def memory(n_footprints, tmp_dir):
+    filenames = []
+    for i in range(n_footprints):
+        filename = os.path.join(tmp_dir, 'Synthetic_{i}.kicad_mod'.format(i=i))
+        with open(filename, 'w') as f:
+            f.write(synthetic_footprint(16 + i % 32, seed=i))
+        filenames.append(filename)
+
+    try:
+        for compact in [False, True]:
+            name = 'compact' if compact else 'lists'
+            tree = bytes_per_footprint(lambda f: sexpr.parse_sexp_file(f, compact=compact), filenames)
+            module = bytes_per_footprint(lambda f: load_module(f, compact), filenames)
+            print("{name:<8} tree: {t:8.0f} bytes per footprint, KicadMod with pads: {m:8.0f} bytes per footprint".format(
+                name=name, t=tree, m=module))
+    finally:
+        for filename in filenames:
+            os.remove(filename)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark KicadMod on synthetic footprints')
+    parser.add_argument('--pads', help='number of pads in the synthetic footprint', type=int, default=10000)
+    parser.add_argument('--repeat', help='number of runs (best is reported)', type=int, default=3)
+    parser.add_argument('--footprints', help='measure the memory used by this many footprints loaded at once', type=int)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+
+    if args.footprints:
+        memory(args.footprints, tmp_dir)
+        os.rmdir(tmp_dir)
+        sys.exit(0)
+    src = os.path.join(tmp_dir, 'Synthetic.kicad_mod')
+    dst = os.path.join(tmp_dir, 'Synthetic_out.kicad_mod')
+
+    with open(src, 'w') as f:
+        f.write(synthetic_footprint(args.pads))
+
+    start = time.perf_counter()
+    module = KicadMod(src)
+    module.pads
+    print("load: {s:.3f} s ({n} pads)".format(s=time.perf_counter() - start, n=len(module.pads)))
+
+    elapsed = bench(lambda: legacy_save(module, dst), args.repeat)
+    print("save (string concatenation): {s:.3f} s".format(s=elapsed))
+
+    elapsed = bench(lambda: module.save(dst), args.repeat)
+    print("save (streaming):            {s:.3f} s".format(s=elapsed))
+
+    os.remove(src)
+    os.remove(dst)
+    os.rmdir(tmp_dir)
@@ -12,6 +12,8 @@ common = os.path.abspath(os.path.join(sys.path[0], '..', 'common'))
 if not common in sys.path:
     sys.path.append(common)
 
+import sexpr
+
 
 # For Python 2 compatibility
 try:
@@ -108,13 +110,15 @@ def parse_module(filename, warnings):
 
     if config.verbose:
         printer.green('Parsing: {f:s}'.format(f=filename))
+    # Only the first (model ...) is needed, stop reading the file there
     try:
-        module = KicadMod(filename)
+        with open(filename) as f:
+            models = list(sexpr.iter_subtrees(f, 'model', max_count=1))
     except FileNotFoundError:
         printer.red('EXIT: problem reading module file {fn:s}'.format(fn=filename))
         sys.exit(1)
     try:
-        long_reference = module.models[0]['file']
+        long_reference = models[0][1]
     except IndexError:
         printer.yellow("- No model file specified in {fn:s}".format(fn=filename))
         warnings += 1
@@ -5,11 +5,26 @@ from __future__ import print_function
 import argparse
 
 import sys,os
-import re
 import glob
 
-regex_str = "\(\s*pad\s*[^\s]+\s*(?:smd|thru_hole)\s*(?:roundrect|custom)"
-regex_pattern = re.compile(regex_str)
+common = os.path.abspath(os.path.join(sys.path[0], '..','common'))
+
+if not common in sys.path:
+    sys.path.append(common)
+
+import sexpr
+
+# (pad <number> <type> <shape> ...) shapes unknown to KiCad version 4
+incompatible_types = ['smd', 'thru_hole']
+incompatible_shapes = ['roundrect', 'custom']
+
+def isIncompatible(filename):
+    # Only (pad ...) subtrees are built, and reading stops at the first hit
+    with open(filename, 'r') as fp_file:
+        for pad in sexpr.iter_subtrees(fp_file, 'pad'):
+            if len(pad) > 3 and pad[2] in incompatible_types and pad[3] in incompatible_shapes:
+                return True
+    return False
 
 parser = argparse.ArgumentParser(description='Checks KiCad footprint libs for compatibility with version 4. Outputs a list of incompatible footprints. (optionally removes them to allow the lib to be used with KiCad version 4)')
 parser.add_argument('libs', nargs='+')
@@ -25,11 +40,8 @@ for lib in args.libs:
 
     #print(glob.glob('{:}*.kicad_mod'.format(lib)))
     for fp in glob.glob('{:}*.kicad_mod'.format(lib)):
-        with open(fp, 'r') as fp_file:
-            for line in fp_file.readlines():
-                if re.search(regex_pattern, line):
-                    invalid.append(fp)
-                    break
+        if isIncompatible(fp):
+            invalid.append(fp)
 
 print('\n'.join(invalid))
 
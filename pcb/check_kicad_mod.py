@@ -3,6 +3,7 @@
 from __future__ import print_function
 
 import argparse
+import atexit
 import traceback
 
 import sys,os
@@ -17,7 +18,8 @@ from print_color import *
 from rules import __all__ as all_rules
 from rules import *
 from rules.rule import KLCRule
-from rulebase import logError
+from rulebase import ErrorLog
+import sexpr
 
 # enable windows wildcards
 from glob import glob
@@ -33,7 +35,10 @@ parser.add_argument('-v', '--verbose', help='Enable verbose output. -v shows bri
 parser.add_argument('-s', '--silent', help='skip output for symbols passing all checks', action='store_true')
 parser.add_argument('-e', '--errors', help='Do not suppress fatal parsing errors', action='store_true')
 parser.add_argument('-l', '--log', help="Path to JSON file to log error information")
+parser.add_argument('--log-format', help='Format of the log file: a JSON dict (default), or JSON Lines appended to the file (several runs can share it)', choices=['json', 'jsonl'], default='json')
+parser.add_argument('--log-warnings', help='Log warnings as well as errors', action='store_true')
 parser.add_argument('-w', '--nowarnings', help='Hide warnings (only show errors)', action='store_true')
+parser.add_argument('--cache-dir', help='Directory to cache parsed footprints in, unchanged files are not parsed again (default: $KICAD_UTILS_CACHE_DIR)', action='store')
 
 args = parser.parse_args()
 if args.fixmore:
@@ -48,6 +53,15 @@ if args.verbose:
 
 KLCRule.verbosity = verbosity
 
+if args.cache_dir:
+    sexpr.enable_cache(args.cache_dir)
+
+# the log file is written once, when the check exits
+error_log = None
+if args.log:
+    error_log = ErrorLog(args.log, args.log_format)
+    atexit.register(error_log.flush)
+
 exit_code = 0
 
 if args.rule:
@@ -127,6 +141,9 @@ for filename in files:
             printer.yellow("Violating " + rule.name, indentation=2)
             rule.processOutput(printer, args.verbose, args.silent)
 
+        if error_log and args.log_warnings and rule.hasWarnings:
+            error_log.logError(rule.name, lib_name, module.name, warning=True)
+
         if args.fixmore and rule.needsFixMore:
             if rule.hasErrors():
                 n_violations += rule.errorCount
@@ -140,8 +157,8 @@ for filename in files:
             if args.fixmore and rule.hasWarnings:
                 n_violations += rule.warningCount()
 
-            if args.log:
-                logError(args.log, rule.name, lib_name, module.name)
+            if error_log:
+                error_log.logError(rule.name, lib_name, module.name)
 
             if args.fix:
                 rule.fix()
@@ -6,11 +6,17 @@ from __future__ import division
 import time
 import re, math
 import sys, os
+from collections import defaultdict
+from functools import cached_property
 sys.path.append(os.path.join('..','common'))
 
 import sexpr
+from atomicwrite import atomicWrite
 from boundingbox import BoundingBox
 
+# types of the arrays of a parsed tree (normal or compact)
+_ARRAY_TYPES = (list, sexpr.SexprNode)
+
 # Rotate a point by given angle (in degrees)
 def _rotatePoint(point, degrees):
 
@@ -49,18 +55,39 @@ def _movePoint(point, offset):
 class KicadMod(object):
     """
     A class to parse kicad_mod files format of the KiCad
+
+    Texts, graphics, pads and models are extracted on first access.
+    With header_only=True the file is only read up to the first text,
+    graphic item, pad or model, so only the header values (name, layer,
+    description, tags, attribute, ...) are available and the footprint
+    cannot be saved.
+
+    With compact=True sexpr_data is kept as a compact (read-only) tree,
+    see sexpr.compact_tree, to load many footprints at once.
     """
-    def __init__(self, filename):
-        self.filename = filename
 
-        # read the s-expression data
-        f = open(filename)
-        sexpr_data = ''.join(f.readlines())
+    # first elements which are not part of the header
+    _BODY_KEYS = ['fp_text', 'fp_line', 'fp_circle', 'fp_arc', 'fp_poly', 'fp_curve', 'pad', 'model']
+
+    def __init__(self, filename, header_only=False, compact=False):
+        self.filename = filename
+        self.header_only = header_only
+
+        # read and parse the s-expression data
+        # (the parse cache is used when enabled, see sexpr.enable_cache)
+        if header_only:
+            with open(filename) as f:
+                sexpr_data = sexpr.parse_sexp_head(f, self._BODY_KEYS)
+            if compact:
+                sexpr_data = sexpr.compact_tree(sexpr_data)
+        else:
+            sexpr_data = sexpr.parse_sexp_file(filename, compact=compact)
 
-        # parse s-expr
-        sexpr_data = sexpr.parse_sexp(sexpr_data)
         self.sexpr_data = sexpr_data
 
+        # index of the arrays of sexpr_data, built on first lookup
+        self._index = None
+
         # module name
         self.name = self.sexpr_data[1]
 
@@ -89,42 +116,99 @@ class KicadMod(object):
         # attribute
         self.attribute =  self._getValue('attr', 'pth', 2)
 
-        # reference
-        self.reference = self._getText('reference')[0]
-
-        # value
-        self.value = self._getText('value')[0]
-
-        # user text
-        self.userText = self._getText('user')
-
-        # lines
-        self.lines = self._getLines()
-
-        # circles
-        self.circles = self._getCircles()
-
-        # arcs
-        self.arcs = self._getArcs()
-
-        # pads
-        self.pads = self._getPads()
-
-        # models
-        self.models = self._getModels()
+    # reference
+    @cached_property
+    def reference(self):
+        return self._getText('reference')[0]
+
+    # value
+    @cached_property
+    def value(self):
+        return self._getText('value')[0]
+
+    # user text
+    @cached_property
+    def userText(self):
+        return self._getText('user')
+
+    # lines
+    @cached_property
+    def lines(self):
+        return self._getLines()
+
+    # circles
+    @cached_property
+    def circles(self):
+        return self._getCircles()
+
+    # arcs
+    @cached_property
+    def arcs(self):
+        return self._getArcs()
+
+    # pads
+    @cached_property
+    def pads(self):
+        return self._getPads()
+
+    # models
+    @cached_property
+    def models(self):
+        return self._getModels()
 
     # check if value exists in any element of data
     def _hasValue(self, data, value):
         for i in data:
-            if type(i) in [list, tuple]:
+            if isinstance(i, (list, tuple)):
                 if self._hasValue(i, value):
                     return True
             elif str(i) == value:
                 return True
         return False
 
+    # map every string element of sexpr_data to the arrays containing it
+    # the arrays are stored with their nesting level, in the same order as
+    # _getArray would find them, so the whole tree is only walked once
+    def _buildIndex(self):
+        index = {}
+
+        def walk(data, level):
+            for i in data:
+                if type(i) in _ARRAY_TYPES:
+                    walk(i, level + 1)
+                elif type(i) == str:
+                    if i in index:
+                        index[i].append((level, data))
+                    else:
+                        index[i] = [(level, data)]
+
+        walk(self.sexpr_data, 0)
+        self._index = index
+
+    # map each atom of a subtree to the arrays containing it, in the order
+    # _getArray would return them (missing atoms map to an empty list)
+    def _arrayIndex(self, data):
+        index = defaultdict(list)
+
+        def walk(data):
+            for i in data:
+                if type(i) in _ARRAY_TYPES:
+                    walk(i)
+                elif type(i) == str:
+                    index[i].append(data)
+
+        walk(data)
+        return index
+
     # return the array which has value as first element
     def _getArray(self, data, value, result=None, level=0, max_level = None):
+        # lookups from the root are answered by the index
+        if result is None and level == 0 and data is self.sexpr_data and type(value) == str:
+            if self._index is None:
+                self._buildIndex()
+            return [a for l, a in self._index.get(value, ())
+                    if max_level is None or l < max_level]
+
         if result is None: result = []
 
         if max_level is not None and max_level <= level:
@@ -133,7 +217,7 @@ class KicadMod(object):
         level += 1
 
         for i in data:
-            if type(i) == type([]):
+            if type(i) in _ARRAY_TYPES:
                 self._getArray(i, value, result, level=level,
                         max_level=max_level)
             else:
@@ -151,6 +235,7 @@ class KicadMod(object):
             index = self.sexpr_data.index(found_array[0])
             self.sexpr_data.pop(index)
             self.sexpr_data.insert(index, array)
+            self._index = None
         else:
             self._createArray(array, place_after)
 
@@ -169,6 +254,8 @@ class KicadMod(object):
             # case doesn't find any desired position, append to end of the array
             self.sexpr_data.append(new_array)
 
+        self._index = None
+
     # return the second element of the array because the array is expected
     # to have the following format: [key value]
     # returns def_value if not field the value
@@ -314,44 +401,50 @@ class KicadMod(object):
     def _getPads(self):
         pads = []
         for pad in self._getArray(self.sexpr_data, 'pad'):
+            # all arrays of the pad, collected in a single pass
+            arrays = self._arrayIndex(pad)
+
             # number, type, shape
             pad_dict = {'number':pad[1], 'type':pad[2], 'shape':pad[3]}
 
             # position
-            a = self._getArray(pad, 'at')[0]
+            a = arrays['at'][0]
             pad_dict['pos'] = {'x':a[1], 'y':a[2], 'orientation':0}
             if len(a) > 3: pad_dict['pos']['orientation'] = a[3]
 
             # size
-            a = self._getArray(pad, 'size')[0]
+            a = arrays['size'][0]
             pad_dict['size'] = {'x':a[1], 'y':a[2]}
 
             # layers
-            a = self._getArray(pad, 'layers')[0]
-            pad_dict['layers'] = a[1:]
+            a = arrays['layers'][0]
+            pad_dict['layers'] = list(a[1:])
 
             # rect delta
             pad_dict['rect_delta'] = {}
-            a = self._getArray(pad, 'rect_delta')
-            if a: pad_dict['rect_delta'] = a[0][1:]
+            a = arrays['rect_delta']
+            if a: pad_dict['rect_delta'] = list(a[0][1:])
 
             # drill
             pad_dict['drill'] = {}
-            drill = self._getArray(pad, 'drill')
+            drill = arrays['drill']
             if drill:
                 # there is only one drill per pad
                 drill = drill[0]
 
                 # offset
                 pad_dict['drill']['offset'] = {}
-                offset = self._getArray(drill, 'offset')
+                offset = self._arrayIndex(drill)['offset']
                 if offset:
                     offset = offset[0]
                     pad_dict['drill']['offset'] = {'x':offset[1], 'y':offset[2]}
-                    drill.remove(offset)
+
+                # the remaining items are shape and size
+                # (taken from a copy, the parse tree is left untouched)
+                drill = [i for i in drill if i is not offset]
 
                 # shape
-                if self._hasValue(drill, 'oval'):
+                if 'oval' in drill:
                     drill.remove('oval')
                     pad_dict['drill']['shape'] = 'oval'
                 else:
@@ -366,69 +459,70 @@ class KicadMod(object):
 
             # die length
             pad_dict['die_length'] = {}
-            a = self._getArray(pad, 'die_length')
+            a = arrays['die_length']
             if a: pad_dict['die_length'] = a[0][1]
 
             ## clearances zones settings
             # clearance
             pad_dict['clearance'] = {}
-            a = self._getArray(pad, 'clearance')
+            a = arrays['clearance']
             if a: pad_dict['clearance'] = a[0][1]
             # solder mask margin
             pad_dict['solder_mask_margin'] = {}
-            a = self._getArray(pad, 'solder_mask_margin')
+            a = arrays['solder_mask_margin']
             if a: pad_dict['solder_mask_margin'] = a[0][1]
             # solder paste margin
             pad_dict['solder_paste_margin'] = {}
-            a = self._getArray(pad, 'solder_paste_margin')
+            a = arrays['solder_paste_margin']
             if a: pad_dict['solder_paste_margin'] = a[0][1]
             # solder paste margin ratio
             pad_dict['solder_paste_margin_ratio'] = {}
-            a = self._getArray(pad, 'solder_paste_margin_ratio')
+            a = arrays['solder_paste_margin_ratio']
             if a: pad_dict['solder_paste_margin_ratio'] = a[0][1]
 
             ## copper zones settings
             # zone connect
             pad_dict['zone_connect'] = {}
-            a = self._getArray(pad, 'zone_connect')
+            a = arrays['zone_connect']
             if a: pad_dict['zone_connect'] = a[0][1]
             # thermal width
             pad_dict['thermal_width'] = {}
-            a = self._getArray(pad, 'thermal_width')
+            a = arrays['thermal_width']
             if a: pad_dict['thermal_width'] = a[0][1]
             # thermal gap
             pad_dict['thermal_gap'] = {}
-            a = self._getArray(pad, 'thermal_gap')
+            a = arrays['thermal_gap']
             if a: pad_dict['thermal_gap'] = a[0][1]
 
             # Custom pad shape settings
             if pad_dict['shape'] == 'custom':
                 # Get options
                 pad_dict['options'] = {'clearance': {}, 'anchor': {}}
-                a = self._getArray(pad, 'options')
-                c = self._getArray(a, 'clearance')
+                options = self._arrayIndex(arrays['options'])
+                c = options['clearance']
                 if c:
                     pad_dict['options']['clearance'] = c[0][1]
-                c = self._getArray(a, 'anchor')
+                c = options['anchor']
                 if c:
                     pad_dict['options']['anchor'] = c[0][1]
 
                 # Get primitives
                 pad_dict['primitives'] = []
-                a = self._getArray(pad, 'primitives')
+                a = arrays['primitives']
                 if a:
                     for primitive in a[0][1:]:
                         p = {}
+                        parts = self._arrayIndex(primitive)
                         # Everything has a width
                         p['width'] = {}
-                        w = self._getArray(primitive, 'width')
+                        w = parts['width']
                         if w: p['width'] = w[0][1]
                         # Set primitive type
                         p['type'] = primitive[0]
                         if primitive[0] == 'gr_poly':
                             # Read the polygon's points
                             p['pts'] = []
-                            pts = self._getArray(primitive, 'pts')
+                            pts = parts['pts']
                             for pt in pts[0][1:]:
                                 p['pts'].append({
                                     'x': pt[1],
@@ -436,33 +530,33 @@ class KicadMod(object):
                         elif primitive[0] == 'gr_line':
                             # Read the line's start
                             p['start'] = {}
-                            s = self._getArray(primitive, 'start')
+                            s = parts['start']
                             if s: p['start'] = {'x': s[0][1], 'y': s[0][2]}
                             # Read the line's end
                             p['end'] = {}
-                            e = self._getArray(primitive, 'end')
+                            e = parts['end']
                             if e: p['end'] = {'x': e[0][1], 'y': e[0][2]}
                         elif primitive[0] == 'gr_arc':
                             # Read the arc's start
                             p['start'] = {}
-                            s = self._getArray(primitive, 'start')
+                            s = parts['start']
                             if s: p['start'] = {'x': s[0][1], 'y': s[0][2]}
                             # Read the arc's end
                             p['end'] = {}
-                            e = self._getArray(primitive, 'end')
+                            e = parts['end']
                             if e: p['end'] = {'x': e[0][1], 'y': e[0][2]}
                             # Read the arc's angle
                             p['angle'] = {}
-                            n = self._getArray(primitive, 'angle')
+                            n = parts['angle']
                             if n: p['angle'] = n[0][1]
                         elif primitive[0] == 'gr_circle':
                             # Read the line's start
                             p['center'] = {}
-                            c = self._getArray(primitive, 'center')
+                            c = parts['center']
                             if c: p['center'] = {'x': c[0][1], 'y': c[0][2]}
                             # Read the line's end
                             p['end'] = {}
-                            e = self._getArray(primitive, 'end')
+                            e = parts['end']
                             if e: p['end'] = {'x': e[0][1], 'y': e[0][2]}
 
                         pad_dict['primitives'].append(p)
@@ -995,11 +1089,24 @@ class KicadMod(object):
 
         se.endGroup(newline=True)
 
+    # filename can also be an open (text) file object
+    # the output is written to the file as it is generated
     def save(self, filename=None):
+        if self.header_only:
+            raise RuntimeError("'{fn}' was loaded with header_only, it cannot be saved".format(fn=self.filename))
+
         if not filename:
             filename = self.filename
 
-        se = sexpr.SexprBuilder('module')
+        if hasattr(filename, 'write'):
+            self._save(filename)
+            return
+
+        # a failure leaves the original file untouched
+        atomicWrite(filename, self._save)
+
+    def _save(self, f):
+        se = sexpr.SexprBuilder('module', stream=f)
 
         # Hex value of current epoch timestamp (in seconds)
         tedit = hex(int(time.time())).upper()[2:]
@@ -1079,9 +1186,7 @@ class KicadMod(object):
 
         se.endGroup(True)
 
-        with open(filename, 'w', newline='\n') as f:
-            f.write(se.output)
-            f.write('\n')
+        f.write('\n')
 
 if __name__ == '__main__':
     pass
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark for loading symbol libraries with the SchLib class.
+
+A synthetic library (MCU-like symbols with many pins, plus its .dcm) of
+the given size is generated and loaded, once with the original shlex
+based line tokenizer and once with the current one.
+
+    ./benchmark_schlib.py --lib-mb 50
+
+With --jobs N, several synthetic libraries are loaded with
+schlib.load_libraries, with 1 to N worker processes:
+
+    ./benchmark_schlib.py --jobs 8 --libs 16 --lib-mb 3
+
+With --dcm-entries N, a documentation file of N entries is read and
+written back, with the writer used before (which built the whole file in
+the header list) and with the current one:
+
+    ./benchmark_schlib.py --dcm-entries 20000
+"""
+
+from __future__ import print_function
+
+import argparse
+import hashlib
+import os
+import random
+import shlex
+import shutil
+import sys
+import tempfile
+import time
+
+import schlib
+from schlib import SchLib
+
+_PIN_TYPES = ['I', 'O', 'B', 'T', 'P', 'U', 'W', 'w', 'C', 'E', 'N']
+_PIN_SHAPES = ['', 'I', 'C', 'CI', 'L', 'N']
+
+def synthetic_symbol(name, n_pins, seed=0, aliases=()):
+    """
+    Return the lines of a DEF...ENDDEF block with n_pins pins
+    """
+    rnd = random.Random(seed)
+    height = (n_pins // 4 + 2) * 100
+    lines = ['#\n',
+             '# {name}\n'.format(name=name),
+             '#\n',
+             'DEF {name} U 0 20 Y Y 1 F N\n'.format(name=name),
+             'F0 "U" -1400 {y} 50 H V L CNN\n'.format(y=height + 100),
+             'F1 "{name}" 1000 {y} 50 H V L CNN\n'.format(name=name, y=height + 100),
+             'F2 "Package_QFP:LQFP-{n}_14x14mm_P0.5mm" 0 0 50 H I C CNN\n'.format(n=n_pins),
+             'F3 "" 0 0 50 H I C CNN\n',
+             'F4 "Synthetic part {name}" 0 0 50 H I C CNN "Description"\n'.format(name=name)]
+    if aliases:
+        lines.append('ALIAS {aliases}\n'.format(aliases=' '.join(aliases)))
+    lines += ['$FPLIST\n',
+              ' LQFP*14x14mm*P0.5mm*\n',
+              '$ENDFPLIST\n',
+              'DRAW\n',
+              'S -1400 -{h} 1400 {h} 0 1 10 f\n'.format(h=height),
+              'T 0 0 {y} 50 0 0 1 "Synthetic text" Normal 0 C C\n'.format(y=height - 100),
+              'P 3 0 1 0 -100 0 0 100 100 0 N\n',
+              'C 0 0 50 0 1 0 N\n',
+              'A 0 0 100 900 -900 0 1 0 N 0 100 0 -100\n']
+    for i in range(n_pins):
+        side = i % 4
+        offset = (i // 4) * 100 - height + 100
+        if side == 0:
+            pos, direction = (-1600, offset), 'R'
+        elif side == 1:
+            pos, direction = (1600, offset), 'L'
+        elif side == 2:
+            pos, direction = (offset, height + 200), 'D'
+        else:
+            pos, direction = (offset, -height - 200), 'U'
+        pin_name = 'P{port}{bit}'.format(port='ABCDEFGH'[(i // 16) % 8], bit=i % 16)
+        if rnd.random() < 0.1:
+            pin_name = '~{' + pin_name + '}'
+        lines.append('X {name} {num} {x} {y} 200 {d} 50 50 1 1 {t}{shape}\n'.format(
+            name=pin_name, num=i + 1, x=pos[0], y=pos[1], d=direction,
+            t=rnd.choice(_PIN_TYPES), shape=(' ' + rnd.choice(_PIN_SHAPES)).rstrip()))
+    lines += ['ENDDRAW\n',
+              'ENDDEF\n']
+    return lines
+
+def synthetic_doc(name):
+    """
+    Return the lines of a $CMP...$ENDCMP block
+    """
+    return ['#\n',
+            '$CMP {name}\n'.format(name=name),
+            'D Synthetic part {name}, 64k flash, 20k RAM\n'.format(name=name),
+            'K synthetic benchmark MCU\n',
+            'F http://example.com/{name}.pdf\n'.format(name=name),
+            '$ENDCMP\n']
+
+def write_synthetic_library(filename, size_mb, seed=0):
+    """
+    Write a .lib of about size_mb megabytes and its .dcm, return the
+    number of symbols
+    """
+    rnd = random.Random(seed)
+    size = size_mb * 1e6
+    written = 0
+    count = 0
+    dcm = os.path.splitext(filename)[0] + '.dcm'
+    with open(filename, 'w', newline='\n') as lib, open(dcm, 'w', newline='\n') as doc:
+        lib.write('EESchema-LIBRARY Version 2.4\n#encoding utf-8\n')
+        doc.write('EESchema-DOCLIB  Version 2.0\n')
+        while written < size:
+            name = 'SYNTH{n:06d}'.format(n=count)
+            aliases = [name + 'A'] if count % 5 == 0 else []
+            block = ''.join(synthetic_symbol(name, rnd.choice([32, 48, 64, 100, 144]), seed=count, aliases=aliases))
+            lib.write(block)
+            written += len(block)
+            for n in [name] + aliases:
+                doc.write(''.join(synthetic_doc(n)))
+            count += 1
+        lib.write('#\n#End Library\n')
+        doc.write('#\n#End Doc Library\n')
+    return count
+
+def write_synthetic_documentation(filename, n_entries):
+    names = sorted('SYNTH{n:06d}'.format(n=n) for n in range(n_entries))
+    with open(filename, 'w', newline='\n') as doc:
+        doc.write('EESchema-DOCLIB  Version 2.0\n')
+        for name in names:
+            doc.write(''.join(synthetic_doc(name)))
+        doc.write('#\n#End Doc Library\n')
+
+def legacy_save_documentation(documentation, filename):
+    # Documentation.save as it was before the streaming writer
+    to_write = list(documentation.header)
+
+    items = sorted(documentation.components.items(), key = lambda item: item[0])
+
+    for name,doc in items:
+        to_write.append('#\n')
+        to_write.append(documentation.line_keys['start']+name+'\n')
+        for key in doc.keys():
+            if(doc[key]!=None):
+                to_write.append( documentation.line_keys[key]+doc[key]+'\n')
+        to_write.append(documentation.line_keys['end']+'\n')
+    to_write.append("#\n")
+    to_write.append("#End Doc Library\n")
+
+    f = open(filename, 'w', newline='\n')
+    f.writelines(to_write)
+    f.close()
+
+def documentation_round_trip(filename, n_entries):
+    """
+    Return the times of reading, writing with the legacy writer, writing
+    and writing an unchanged file, and whether both writers reproduced the
+    file
+    """
+    write_synthetic_documentation(filename, n_entries)
+    with open(filename, 'rb') as f:
+        original = f.read()
+
+    start = time.perf_counter()
+    documentation = schlib.Documentation(filename)
+    read = time.perf_counter() - start
+
+    legacy = filename + '.legacy'
+    start = time.perf_counter()
+    legacy_save_documentation(documentation, legacy)
+    legacy_write = time.perf_counter() - start
+
+    # the new file is written, then the unchanged one is only compared
+    written = filename + '.new'
+    start = time.perf_counter()
+    documentation.save(written)
+    write = time.perf_counter() - start
+
+    start = time.perf_counter()
+    documentation.save(written)
+    unchanged = time.perf_counter() - start
+
+    same = True
+    for output in [legacy, written]:
+        with open(output, 'rb') as f:
+            same = same and f.read() == original
+    return read, legacy_write, write, unchanged, same
+
+def shlex_split_line(line):
+    # tokenizer of Component as it was before the compiled regex
+    s = shlex.shlex(line)
+    s.whitespace_split = True
+    s.commenters = ''
+    s.quotes = '"'
+    return list(s)
+
+def load(filename, split_line):
+    saved = schlib._splitLine
+    schlib._splitLine = split_line
+    try:
+        start = time.perf_counter()
+        lib = SchLib(filename)
+        return lib, time.perf_counter() - start
+    finally:
+        schlib._splitLine = saved
+
+def scaling(filenames, max_jobs):
+    """
+    Return (jobs, seconds) of loading the libraries with 1, 2, 4, ...
+    max_jobs worker processes
+    """
+    jobs = [1]
+    while jobs[-1] * 2 < max_jobs:
+        jobs.append(jobs[-1] * 2)
+    if max_jobs > 1:
+        jobs.append(max_jobs)
+
+    reference = None
+    times = []
+    for n in jobs:
+        start = time.perf_counter()
+        libs = schlib.load_libraries(filenames, jobs=n)
+        # the components are fully built
+        parsed = [summary(lib) for lib in libs]
+        times.append((n, time.perf_counter() - start))
+
+        # only a digest is kept, so that the workers of the next run are
+        # not forked from a large process
+        parsed = hashlib.md5(repr(parsed).encode('utf-8')).hexdigest()
+        del libs
+
+        if reference is None:
+            reference = parsed
+        elif parsed != reference:
+            print("Libraries loaded with {n} jobs differ!".format(n=n))
+    return times
+
+def summary(lib):
+    return [(c.name, c.definition, c.fields, c.aliases, c.fplist, c.drawOrdered) for c in lib.components]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark SchLib loading on a synthetic library')
+    parser.add_argument('--lib-mb', help='size of the synthetic library (MB)', type=float, default=50)
+    parser.add_argument('--jobs', help='measure load_libraries with up to this many worker processes', type=int)
+    parser.add_argument('--libs', help='number of synthetic libraries for --jobs', type=int, default=16)
+    parser.add_argument('--dcm-entries', help='measure a read/write round trip of a documentation file with this many entries', type=int)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        if args.dcm_entries:
+            filename = os.path.join(tmp_dir, 'Synthetic.dcm')
+            read, legacy_write, write, unchanged, same = documentation_round_trip(filename, args.dcm_entries)
+            print("{n} entries, {mb:.1f} MB".format(n=args.dcm_entries, mb=os.path.getsize(filename) / 1e6))
+            print("read:              {s:8.3f} s".format(s=read))
+            print("write (legacy):    {s:8.3f} s".format(s=legacy_write))
+            print("write (streaming): {s:8.3f} s".format(s=write))
+            print("write (unchanged): {s:8.3f} s".format(s=unchanged))
+            if not same:
+                print("Written files differ from the original!")
+            sys.exit(0)
+
+        if args.jobs:
+            filenames = []
+            for i in range(args.libs):
+                filename = os.path.join(tmp_dir, 'Synthetic_{n}.lib'.format(n=i))
+                write_synthetic_library(filename, args.lib_mb, seed=i)
+                filenames.append(filename)
+            print("{n} libraries, {mb:.1f} MB".format(n=len(filenames), mb=sum(os.path.getsize(f) for f in filenames) / 1e6))
+
+            times = scaling(filenames, args.jobs)
+            for n, elapsed in times:
+                print("{n:3d} job(s): {s:8.2f} s  x{speedup:.2f}".format(n=n, s=elapsed, speedup=times[0][1] / elapsed))
+            sys.exit(0)
+
+        filename = os.path.join(tmp_dir, 'Synthetic.lib')
+        count = write_synthetic_library(filename, args.lib_mb)
+        print("{n} symbols, {mb:.1f} MB".format(n=count, mb=os.path.getsize(filename) / 1e6))
+
+        legacy, elapsed = load(filename, shlex_split_line)
+        print("load (shlex):    {s:8.2f} s".format(s=elapsed))
+        lib, elapsed = load(filename, schlib._splitLine)
+        print("load (compiled): {s:8.2f} s".format(s=elapsed))
+
+        if summary(lib) != summary(legacy):
+            print("Parsed symbols differ from the shlex tokenizer!")
+    finally:
+        shutil.rmtree(tmp_dir)
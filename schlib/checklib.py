@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import atexit
+import hashlib
 import sys, os
 
 common = os.path.abspath(os.path.join(sys.path[0], '..','common'))
@@ -15,8 +17,11 @@ from print_color import *
 import re
 from rules import __all__ as all_rules
 from rules import *
-from rules.rule import KLCRule
-from rulebase import logError
+from rules.rule import KLCRule, KLCLibraryRule
+from rulebase import ErrorLog, KLCRuleBase, Scope
+from filecache import FileCache
+import math
+import traceback
 
 #enable windows wildcards
 from glob import glob
@@ -31,137 +36,399 @@ parser.add_argument('--nocolor', help='does not use colors to show the output',
 parser.add_argument('-v', '--verbose', help='Enable verbose output. -v shows brief information, -vv shows complete information', action='count')
 parser.add_argument('-s', '--silent', help='skip output for symbols passing all checks', action='store_true')
 parser.add_argument('-l', '--log', help='Path to JSON file to log error information')
+parser.add_argument('--log-format', help='Format of the log file: a JSON dict (default), or JSON Lines appended to the file (several runs can share it)', choices=['json', 'jsonl'], default='json')
+parser.add_argument('--log-warnings', help='Log warnings as well as errors', action='store_true')
 parser.add_argument('-w', '--nowarnings', help='Hide warnings (only show errors)', action='store_true')
 parser.add_argument('--footprints', help='Path to footprint libraries (.pretty dirs). Specify with e.g. "~/kicad/footprints/"')
+parser.add_argument('-j', '--jobs', help='Number of worker processes (default = 1). The output is the same as with a single process', type=int, default=1)
+parser.add_argument('--incremental', metavar='CACHE_DIR', help='Store the results of each symbol in CACHE_DIR, symbols which did not change since they were last checked (with the same rules) are not checked again', action='store')
+parser.add_argument('--cache-dir', help='Directory to cache parsed libraries in, unchanged libraries are not parsed again (default: $KICAD_UTILS_CACHE_DIR)', action='store')
 
-args = parser.parse_args()
+# options of the checks, set by configure
+args = None
 
-printer = PrintColor(use_color = not args.nocolor)
+#grab list of libfiles (even on windows!)
+libfiles = []
 
-# Set verbosity globally
-verbosity = 0
-if args.verbose:
-    verbosity = args.verbose
+# Libraries larger than this are checked in several chunks of components in
+# parallel runs (not with --fix, the library is saved by a single worker, nor
+# with -c or -p)
+CHUNK_SIZE = 1024 * 1024
+
+def rules_version():
+    """
+    Return a hash of what the results of the symbol rules depend on,
+    besides the symbol itself: the selected rules, their code and the
+    footprint libraries (see S5.1)
+    """
+    sha = hashlib.sha1()
+
+    modules = [sys.modules[rule.__module__] for rule in rules]
+    modules += [sys.modules['rules.rule'], sys.modules['rulebase'], sys.modules['schlib']]
+    for module in modules:
+        sha.update(module.__name__.encode('utf-8'))
+        with open(module.__file__, 'rb') as f:
+            sha.update(f.read())
+
+    # adding or removing a footprint changes the modification time of its
+    # .pretty directory
+    if args.footprints and os.path.isdir(args.footprints):
+        sha.update(os.path.abspath(args.footprints).encode('utf-8'))
+        for entry in sorted(os.listdir(args.footprints)):
+            if entry.endswith('.pretty'):
+                mtime = os.stat(os.path.join(args.footprints, entry)).st_mtime_ns
+                sha.update('{name} {mtime}'.format(name=entry, mtime=mtime).encode('utf-8'))
+
+    return sha.hexdigest()
+
+def configure(arguments):
+    """
+    Set the options of the checks (the parsed command line arguments of
+    checklib) and select the rules
+    """
+    global args, printer, verbosity, rules, library_rules, results_cache
+
+    args = arguments
+
+    if args.cache_dir:
+        enable_cache(args.cache_dir)
+
+    printer = PrintColor(use_color = not args.nocolor)
+
+    # Set verbosity globally
+    verbosity = 0
+    if args.verbose:
+        verbosity = args.verbose
+
+    KLCRule.verbosity = verbosity
+    KLCLibraryRule.verbosity = verbosity
+
+    if args.rule:
+        selected_rules = args.rule.split(',')
+    else:
+        #ALL rules are used
+        selected_rules = None
+
+    rules = []
+
+    # rules checked once per library instead of once per symbol
+    library_rules = []
+
+    for r in all_rules:
+        r_name = r.replace('_', '.')
+        if selected_rules == None or r_name in selected_rules:
+            rule = globals()[r].Rule
+            if rule.scope == Scope.LIBRARY:
+                library_rules.append(rule)
+            else:
+                rules.append(rule)
 
-KLCRule.verbosity = verbosity
+    # results of the symbols checked by previous runs (--incremental), keyed
+    # on the fingerprint of the symbol and on rules_version
+    results_cache = None
 
-if args.rule:
-    selected_rules = args.rule.split(',')
-else:
-    #ALL rules are used
-    selected_rules = None
+    if args.incremental:
+        results_cache = FileCache(os.path.join(args.incremental, 'checklib'), rules_version())
 
-rules = []
+class _CachedRule(KLCRuleBase):
+    """
+    The result of a rule for a symbol, replayed from the results cache
+    """
 
-for r in all_rules:
-    r_name = r.replace('_', '.')
-    if selected_rules == None or r_name in selected_rules:
-        rules.append(globals()[r].Rule)
+    name = None
 
-#grab list of libfiles (even on windows!)
-libfiles = []
+    def __init__(self, name, description, messages, error_count, warning_count):
+        KLCRuleBase.__init__(self, description)
 
-if len(all_rules)<=0:
-    printer.red("No rules selected for check!")
-    sys.exit(1)
-else:
-    if (verbosity>2):
-        printer.regular("checking rules:")
-        for rule in all_rules:
-            printer.regular("  - "+str(rule))
-        printer.regular("")
+        self.name = name
+        self.messageBuffer = [list(message) for message in messages]
+        self.error_count = error_count
+        self.warning_count = warning_count
 
-for libfile in args.libfiles:
-    libfiles += glob(libfile)
+    def check(self):
+        pass
 
-if len(libfiles) == 0:
-    printer.red("File argument invalid: {f}".format(f=args.libfiles))
-    sys.exit(1)
+def checked_rules(rules, item, results=None):
+    """
+    Yield the rules checked against an item (a component or a library),
+    one after the other: the fix of a rule is applied before the next
+    rule is checked. The result of each rule is appended to results
+    """
+    for rule in rules:
+        rule = rule(item)
 
-exit_code = 0
+        if args.footprints:
+            rule.footprints_dir = args.footprints
+        else:
+            rule.footprints_dir = None
 
-for libfile in libfiles:
-    lib = SchLib(libfile)
+        if verbosity > 2:
+            printer.white("checking rule" + rule.name)
 
-    # Remove .lib from end of name
-    lib_name = os.path.basename(libfile)[:-4]
+        rule.check()
 
-    n_components = 0
+        if results is not None:
+            results.append((rule.name, rule.description, [tuple(message) for message in rule.messageBuffer],
+                            rule.error_count, rule.warning_count))
 
-    # Print library name
-    if len(libfiles) > 1:
-        printer.purple('Library: %s' % libfile)
+        yield rule
 
-    n_allviolations=0
-    
-    for component in lib.components:
+def check_rules(rules, title, lib_name, item_name, log=None):
+    """
+    Print the output of the checked rules (see checked_rules), title
+    before the first violation, and fix the violations. log is called
+    with the rule, library and item name of each error (see
+    ErrorLog.logError). Return the number of violations and whether
+    anything was printed
+    """
+    n_violations = 0
 
-        #simple match
-        match = True
-        if args.component:
-            match = match and args.component.lower() == component.name.lower()
+    first = True
 
-        #regular expression match
-        if args.pattern:
-            match = match and re.search(args.pattern, component.name, flags=re.IGNORECASE)
+    for rule in rules:
+        if args.nowarnings and not rule.hasErrors():
+            continue
 
-        if not match: continue
+        if rule.hasOutput():
+            if first:
+                printer.green(title)
+                first = False
 
-        n_components += 1
+            printer.yellow("Violating " + rule.name, indentation=2)
+            rule.processOutput(printer, verbosity, args.silent)
 
-        # check the rules
-        n_violations = 0
+        if log:
+            if rule.hasErrors():
+                log(rule.name, lib_name, item_name)
+            if args.log_warnings and rule.hasWarnings:
+                log(rule.name, lib_name, item_name, True)
 
-        first = True
+        # Specifically check for errors
+        if rule.hasErrors():
+            n_violations += rule.errorCount
 
-        for rule in rules:
-            rule = rule(component)
+            if args.fix:
+                rule.fix()
+                rule.processOutput(printer, verbosity, args.silent)
+                rule.recheck()
+
+    return n_violations, not first
+
+def matches(name):
+    """
+    Return whether a symbol is selected by -c and -p
+    """
+    #simple match
+    match = True
+    if args.component:
+        match = match and args.component.lower() == name.lower()
+
+    #regular expression match
+    if args.pattern:
+        match = match and re.search(args.pattern, name, flags=re.IGNORECASE)
+
+    return match
+
+def save_fixes(lib, n_violations):
+    """
+    Save a library fixed by check_library
+    """
+    lib.save()
+    printer.green("saved '{file}' with fixes for {n_violations} violations.".format(file=lib.filename, n_violations=n_violations))
+
+def check_library(libfile, indexes=None, header=False, library_checks=True, log=None, lib=None, save=save_fixes):
+    """
+    Check the components of a library, only those at the positions in
+    indexes if given (see SchLib.getComponent), and save the fixes. The
+    library-scoped rules are checked as well, unless library_checks is
+    False. log is called for each error (see check_rules). lib is the
+    library, if it is already loaded. save is called with the fixed
+    library and the number of violations (see save_fixes). Return the
+    number of items with violations and the number of violations
+    """
+    # when only some symbols are checked, only these are parsed (with
+    # --incremental, the unchanged symbols are not parsed)
+    if lib is None:
+        lib = SchLib(libfile, lazy=bool(args.component or args.pattern or indexes is not None or results_cache))
 
-            if args.footprints:
-                rule.footprints_dir = args.footprints
-            else:
-                rule.footprints_dir = None
+    # Remove .lib from end of name
+    lib_name = os.path.basename(libfile)[:-4]
 
-            if verbosity > 2:
-                printer.white("checking rule" + rule.name)
+    n_components = 0
+    n_failed = 0
 
-            rule.check()
+    # Print library name
+    if header:
+        printer.purple('Library: %s' % libfile)
 
-            if args.nowarnings and not rule.hasErrors():
-                continue
+    n_allviolations=0
 
-            if rule.hasOutput():
-                if first:
-                    printer.green("Checking symbol '{sym}':".format(sym=component.name))
-                    first = False
+    keys = lib.keys()
 
-                printer.yellow("Violating " + rule.name, indentation=2)
-                rule.processOutput(printer, verbosity, args.silent)
+    # the components are taken by position, a name can be used by several
+    # components of a broken library
+    selected = [index for index in (range(len(keys)) if indexes is None else indexes) if matches(keys[index])]
 
-            # Specifically check for errors
-            if rule.hasErrors():
-                n_violations += rule.errorCount
+    # file-wide checks, once for the whole library, unless -c or -p select
+    # none of its symbols
+    if library_checks and library_rules and (selected or not (args.component or args.pattern)):
+        n_violations, printed = check_rules(checked_rules(library_rules, lib),
+            "Checking library '{lib}':".format(lib=lib_name), lib_name, lib_name, log)
 
-                if args.log:
-                    logError(args.log, rule.name, lib_name, component.name)
+        if n_violations > 0:
+            n_failed += 1
+        n_allviolations=n_allviolations+n_violations
 
-                if args.fix:
-                    rule.fix()
-                    rule.processOutput(printer, verbosity, args.silent)
-                    rule.recheck()
+    for index in selected:
+        name = keys[index]
+
+        n_components += 1
+
+        # results of the last check of an unchanged symbol, unless it has
+        # errors to fix
+        results = None
+        if results_cache:
+            key = hashlib.sha1((results_cache.version + lib.getFingerprint(index)).encode('utf-8')).hexdigest()
+            results = results_cache.get(key)
+            if results and args.fix and any(error_count for _, _, _, error_count, _ in results):
+                results = None
+
+        if results is not None:
+            checked = [_CachedRule(*result) for result in results]
+            results = None
+        else:
+            component = lib.getComponent(index)
+            results = [] if results_cache else None
+            checked = checked_rules(rules, component, results)
+
+        # check the rules
+        n_violations, printed = check_rules(checked,
+            "Checking symbol '{sym}':".format(sym=name), lib_name, name, log)
+
+        # a fixed symbol has a new fingerprint
+        if results is not None and not (args.fix and n_violations > 0):
+            results_cache.put(key, results)
 
         # No messages?
-        if first:
+        if not printed:
             if not args.silent:
-                printer.green("Checking symbol '{sym}' - No errors".format(sym=component.name))
+                printer.green("Checking symbol '{sym}' - No errors".format(sym=name))
 
         # check the number of violations
         if n_violations > 0:
-            exit_code += 1
+            n_failed += 1
         n_allviolations=n_allviolations+n_violations
-        
-    if args.fix and n_allviolations > 0:
-        lib.save()
-        printer.green("saved '{file}' with fixes for {n_violations} violations.".format(file=libfile, n_violations=n_allviolations))
 
-sys.exit(exit_code);
+    if args.fix and n_allviolations > 0:
+        save(lib, n_allviolations)
+
+    return n_failed, n_allviolations
+
+class _Recorder(object):
+    # records the writes to stdout or stderr, to replay them in order
+    def __init__(self, writes, stream):
+        self.writes = writes
+        self.stream = stream
+
+    def write(self, text):
+        self.writes.append((self.stream, text))
+
+    def flush(self):
+        pass
+
+def _check_task(task):
+    # run check_library in a worker process, return its output, its
+    # result, the errors to log, the fixed library to save and the
+    # traceback of the exception it raised (if any). The fixes are saved
+    # by the main process, in order: the libraries after one which
+    # failed are left as they are, as in a single process
+    writes = []
+    log = []
+    fixed = []
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = _Recorder(writes, 'stdout')
+    sys.stderr = _Recorder(writes, 'stderr')
+    try:
+        result = check_library(*task, log=lambda *entry: log.append(entry), save=lambda *save: fixed.append(save))
+        return writes, result, log, fixed, None
+    except BaseException:
+        return writes, None, log, [], traceback.format_exc()
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+def _tasks(libfiles):
+    # one task per library, huge libraries are split into chunks
+    for libfile in libfiles:
+        header = len(libfiles) > 1
+        size = os.path.getsize(libfile) if os.path.isfile(libfile) else 0
+
+        if args.fix or args.component or args.pattern or size <= CHUNK_SIZE:
+            yield (libfile, None, header, True)
+            continue
+
+        count = len(SchLib(libfile, lazy=True))
+        n_chunks = min(args.jobs, int(math.ceil(size / float(CHUNK_SIZE))))
+        chunk = int(math.ceil(count / float(n_chunks)))
+        for start in range(0, count, chunk):
+            # the library-scoped rules are checked by the first chunk
+            yield (libfile, range(start, min(start + chunk, count)), header and start == 0, start == 0)
+
+if __name__ == '__main__':
+    configure(parser.parse_args())
+
+    if len(all_rules)<=0:
+        printer.red("No rules selected for check!")
+        sys.exit(1)
+    else:
+        if (verbosity>2):
+            printer.regular("checking rules:")
+            for rule in all_rules:
+                printer.regular("  - "+str(rule))
+            printer.regular("")
+
+    for libfile in args.libfiles:
+        libfiles += glob(libfile)
+
+    if len(libfiles) == 0:
+        printer.red("File argument invalid: {f}".format(f=args.libfiles))
+        sys.exit(1)
+
+    exit_code = 0
+
+    # the log file is written once, when checklib exits
+    error_log = None
+    if args.log:
+        error_log = ErrorLog(args.log, args.log_format)
+        atexit.register(error_log.flush)
+
+    if args.jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        # the workers are configured as well if they do not fork
+        with ProcessPoolExecutor(args.jobs, initializer=configure, initargs=(args,)) as executor:
+            for writes, result, log, fixed, error in executor.map(_check_task, list(_tasks(libfiles))):
+                for stream, text in writes:
+                    getattr(sys, stream).write(text)
+
+                if error_log:
+                    for entry in log:
+                        error_log.logError(*entry)
+
+                # stop as a single process would
+                if error:
+                    executor.shutdown(cancel_futures=True)
+                    sys.stdout.flush()
+                    sys.stderr.write(error)
+                    sys.exit(1)
+
+                for lib, n_violations in fixed:
+                    save_fixes(lib, n_violations)
+
+                exit_code += result[0]
+    else:
+        log = error_log.logError if error_log else None
+        for libfile in libfiles:
+            n_failed, n_violations = check_library(libfile, header=len(libfiles) > 1, log=log)
+            exit_code += n_failed
+
+    sys.exit(exit_code);
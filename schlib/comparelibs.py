@@ -11,6 +11,7 @@ This is to be used to compare an updated library file with a previous version to
 """
 
 import argparse
+import atexit
 import sys
 import os
 from glob import glob
@@ -23,6 +24,8 @@ if not common in sys.path:
 
 from schlib import *
 from print_color import *
+from rulebase import ErrorLog
+import checklib
 
 def ExitError( msg ):
     print(msg)
@@ -38,32 +41,40 @@ parser.add_argument("--nocolor", help="Does not use colors to show the output",
 parser.add_argument("--design-breaking-changes", help="Checks if there have been changes made that would break existing designs using a particular symbol.", action='store_true')
 parser.add_argument("--check-aliases", help="Do not only check symbols but also aliases.", action='store_true')
 parser.add_argument("--shownochanges", help="Show libraries that have not changed", action="store_true")
+parser.add_argument("--cache-dir", help="Directory to cache parsed libraries in, unchanged libraries are not parsed again (default: $KICAD_UTILS_CACHE_DIR)", action="store")
 
 args,extra = parser.parse_known_args()
 
+if args.cache_dir:
+    enable_cache(args.cache_dir)
+
 if not args.new:
     ExitError("New file(s) not supplied")
 
 if not args.old:
     ExitError("Original file(s) not supplied")
 
-def KLCCheck(lib, component):
-
-    # Wrap library in "quotes" if required
-    if " " in lib and '"' not in lib:
-        lib = '"' + lib + '"'
+if args.check:
+    # the checks of 'checklib.py -vv -s' (with the extra arguments) are run
+    # on the libraries loaded here
+    check_args = ['-vv', '-s'] + (['--nocolor'] if args.nocolor else []) + extra
+    checklib.configure(checklib.parser.parse_args(check_args + ['--'] + list(args.new)))
 
-    call = 'python checklib.py {lib} -c={cmp} -vv -s {nocolor}'.format(
-                lib = lib,
-                cmp = component,
-                nocolor = "--nocolor" if args.nocolor else ""
-                )
+    # the violations of all the checks are logged together (-l/--log)
+    error_log = None
+    if checklib.args.log:
+        error_log = ErrorLog(checklib.args.log, checklib.args.log_format)
+        atexit.register(error_log.flush)
 
-    # Pass extra arguments to checklib script
-    if len(extra) > 0:
-        call += ' '.join([str(e) for e in extra])
-
-    return os.system(call)
+def KLCCheck(lib, component):
+    """
+    Check a component of a loaded library, as 'checklib.py -c' does.
+    Return the number of components with violations
+    """
+    checklib.args.component = component
+    log = error_log.logError if error_log else None
+    n_failed, n_violations = checklib.check_library(lib.filename, lib=lib, log=log)
+    return n_failed
 
 printer = PrintColor(use_color = not args.nocolor)
 
@@ -103,7 +114,7 @@ for lib_name in new_libs:
         for cmp in new_lib.components:
 
             if args.check:
-                if not KLCCheck(lib_path, cmp.name) == 0:
+                if not KLCCheck(new_lib, cmp.name) == 0:
                     errors += 1
 
 
@@ -147,7 +158,7 @@ for lib_name in new_libs:
                     lib=lib_name, name=cmp, alias_info=alias_info))
 
             if args.check:
-                if not KLCCheck(lib_path, cmp) == 0:
+                if not KLCCheck(new_lib, cmp) == 0:
                     errors += 1
 
             continue
@@ -192,7 +203,7 @@ for lib_name in new_libs:
                         lib=lib_name, name=cmp, alias_info=alias_info))
 
             if args.check:
-                if not KLCCheck(lib_path, cmp) == 0:
+                if not KLCCheck(new_lib, cmp) == 0:
                     errors += 1
 
     for cmp in old_cmp:
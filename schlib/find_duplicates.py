@@ -32,9 +32,13 @@ parser = argparse.ArgumentParser(description="Find duplicate parts (including al
 parser.add_argument('libfiles', help=".lib file(s)",nargs="+")
 parser.add_argument('-s', '--silent', help='only show errors', action='store_true')
 parser.add_argument('--nocolor', help='does not use color', action='store_true')
+parser.add_argument('--cache-dir', help='Directory to cache parsed libraries in, unchanged libraries are not parsed again (default: $KICAD_UTILS_CACHE_DIR)', action='store')
 
 args = parser.parse_args()
 
+if args.cache_dir:
+    enable_cache(args.cache_dir)
+
 printer = PrintColor(use_color = not args.nocolor)
 
 # Lib files
@@ -55,6 +59,11 @@ for libfile in libfiles:
     # dict of { libname : [alias, alias, alias] }
     unique_names = {}
     
+    # reverse of unique_names: dict of { alias : { libname : position } },
+    # where position is the order of libname in unique_names
+    alias_owners = {}
+    positions = {}
+
     for cmp in lib.components:
     
         alias_list = []
@@ -67,14 +76,12 @@ for libfile in libfiles:
             errors += 1
         else:
             # Check each existing alias
-            for key in unique_names.keys():
-                aliases = unique_names[key]
-                
-                if cmp.name in aliases:
-                    printer.yellow("Component '{cmp}' exists as an alias of '{key}'".format(
-                        cmp = cmp.name,
-                        key = key ))
-                    errors += 1
+            owners = alias_owners.get(cmp.name, {})
+            for key in sorted(owners, key=owners.get):
+                printer.yellow("Component '{cmp}' exists as an alias of '{key}'".format(
+                    cmp = cmp.name,
+                    key = key ))
+                errors += 1
         
         # Check each alias
         for alias in cmp.aliases.keys():
@@ -86,16 +93,21 @@ for libfile in libfiles:
                 errors += 1
                 
             # check each alias against all other aliases
-            for key in unique_names.keys():
-                aliases = unique_names[key]
+            owners = alias_owners.get(alias, {})
+            for key in sorted(owners, key=owners.get):
+                printer.yellow("Component '{cmp}' ALIAS '{alias}' exists as an alias of '{key}'".format(
+                    cmp = cmp.name,
+                    alias = alias,
+                    key = key ))
+                errors += 1
                 
-                if alias in aliases:
-                    printer.yellow("Component '{cmp}' ALIAS '{alias}' exists as an alias of '{key}'".format(
-                        cmp = cmp.name,
-                        alias = alias,
-                        key = key ))
-                    errors += 1
+        # a duplicate replaces the aliases of the previous component
+        for alias in unique_names.get(cmp.name, []):
+            alias_owners[alias].pop(cmp.name, None)
                 
         unique_names[cmp.name] = alias_list
+        position = positions.setdefault(cmp.name, len(positions))
+        for alias in alias_list:
+            alias_owners.setdefault(alias, {})[cmp.name] = position
             
 sys.exit(errors)
@@ -109,6 +109,7 @@ class CheckComponent(object):
 
         pin['length'] = str(new_len)
         pin[pos] = str(new_pos)
+        self.component.changed()
 
 def resize_component_pins(component):
     component = CheckComponent(component)
@@ -43,6 +43,7 @@ class CheckComponent(object):
             (field['text_size'], 50))
         
         field['text_size'] = "50"
+        self.component.changed()
         
     def resize_pin_name_text(self, pin):
         self.print_header()
@@ -50,6 +51,7 @@ class CheckComponent(object):
             (pin['name_text_size'], 50))
         
         pin['name_text_size'] = "50"
+        self.component.changed()
         
     def resize_pin_num_text(self, pin):
         self.print_header()
@@ -57,6 +59,7 @@ class CheckComponent(object):
             (pin['num_text_size'], 50))
         
         pin['num_text_size'] = "50"
+        self.component.changed()
 
 def resize_component_fields(component):
     component = CheckComponent(component)
@@ -13,26 +13,24 @@ parser.add_argument('--create', help='Creates the destination library if does no
 args = parser.parse_args()
 
 # check if the component exists in the source
-src_lib = SchLib(args.source)
-for component in src_lib.components:
-    if args.name == component.name:
-        break
-else:
+# (the libraries are opened lazily: only the moved component is parsed)
+src_lib = SchLib(args.source, lazy=True)
+if not args.name in src_lib:
     print('Error: Cannot find the component in the source library.')
     sys.exit(1)
+component = src_lib[args.name]
 
 # open or create destination library
 try:
-    dst_lib = SchLib(args.destination, args.create)
+    dst_lib = SchLib(args.destination, args.create, lazy=True)
 except FileNotFoundError:
     print('Destination library does not exist. Please, check if path is right or uses create flag to new library.')
     sys.exit(1)
 
 # check if the component exists in the destination
-for comp in dst_lib.components:
-    if component.name == comp.name:
-        print('Error: component "%s" already exists in the destination library.' % (comp.name))
-        sys.exit(1)
+if component.name in dst_lib:
+    print('Error: component "%s" already exists in the destination library.' % (component.name))
+    sys.exit(1)
 
 # append component to destination and save
 dst_lib.addComponent(component)
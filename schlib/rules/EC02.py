@@ -27,8 +27,7 @@ class Rule(KLCRule):
         if len(self.component.draw['rectangles']) != 1:
             return False
 
-        top = max(int(self.component.draw['rectangles'][0]['starty']), int(self.component.draw['rectangles'][0]['endy']))
-        bottom = min(int(self.component.draw['rectangles'][0]['starty']), int(self.component.draw['rectangles'][0]['endy']))
+        x_min, bottom, x_max, top = self.facts.rectangle_bounds[0]
 
         # reference checking
 
@@ -39,7 +38,7 @@ class Rule(KLCRule):
 
         # otherwise, the recommended is put it before the first pin x position, right-aligned
         else:
-            x = min([int(i['posx']) for i in self.component.filterPins(direction='D')]) - 100
+            x = min([self.component.getPinValues(i).posx for i in self.component.filterPins(direction='D')]) - 100
             self.recommended_ref_pos = {'posx': x, 'posy': (top + 125)}
             self.recommended_ref_alignment = 'R'
 
@@ -64,7 +63,7 @@ class Rule(KLCRule):
 
         # otherwise, the recommended is put it before the first pin x position, right-aligned
         else:
-            x = min([int(i['posx']) for i in self.component.filterPins(direction='D')]) - 100
+            x = min([self.component.getPinValues(i).posx for i in self.component.filterPins(direction='D')]) - 100
             self.recommended_name_pos = {'posx': x, 'posy': (top + 50)}
             self.recommended_name_alignment = 'R'
 
@@ -86,7 +85,7 @@ class Rule(KLCRule):
 
         # otherwise, the recommended is put it after the last pin x position, left-aligned
         else:
-            x = max([int(i['posx']) for i in self.component.filterPins(direction='U')]) + 50
+            x = max([self.component.getPinValues(i).posx for i in self.component.filterPins(direction='U')]) + 50
             self.recommended_fp_pos = {'posx': x, 'posy': (bottom - 50)}
             self.recommended_fp_alignment = 'L'
 
@@ -1,14 +1,15 @@
 # -*- coding: utf-8 -*-
 
 from rules.rule import *
+import os
 import platform
 
-class Rule(KLCRule):
+class Rule(KLCLibraryRule):
     """
     Create the methods check and fix to use with the kicad lib files.
     """
-    def __init__(self, component):
-        super(Rule, self).__init__(component, 'Library files must use Unix-style line endings (LF)')
+    def __init__(self, library):
+        super(Rule, self).__init__(library, 'Library files must use Unix-style line endings (LF)')
         self.lib_error = False
         self.dcm_error = False
 
@@ -16,12 +17,14 @@ class Rule(KLCRule):
         # Only perform this check on linux systems (i.e. Travis)
         # Windows automatically checks out with CR+LF line endings
         if 'linux' in platform.platform().lower():
-            if not checkLineEndings(self.component.lib_filename):
+            if not checkLineEndings(self.library.filename):
                 self.lib_error = True
                 self.error("Incorrect line endings (.lib)")
                 self.errorExtra("Library files must use Unix-style line endings (LF)")
 
-            if not checkLineEndings(self.component.dcm_filename):
+            # a missing .dcm file is reported when the library is loaded
+            dcm_filename = self.library.documentation.filename
+            if os.path.isfile(dcm_filename) and not checkLineEndings(dcm_filename):
                 self.dcm_error = True
                 self.error("Incorrect line endings (.dcm)")
                 self.errorExtra("Library files must use Unix-style line endings (LF)")
@@ -19,27 +19,18 @@ class Rule(KLCRule):
 
         # If there is only a single filled rectangle, we assume that it is the
         # main symbol outline.
-        drawing = self.component.draw
-        filled_rects = [rect for rect in drawing['rectangles']
-                        if rect['fill'] == 'f']
+        filled_rects = self.facts.filled_rectangles
         if len(filled_rects) == 1:
             # We now find it's center
             rect = filled_rects[0]
             x = (int(rect['startx']) + int(rect['endx'])) // 2
             y = (int(rect['starty']) + int(rect['endy'])) // 2
         else:
-            pins = self.component.pins
-
             # No pins? Ignore check.
             # This can be improved to include graphical items too...
-            if len(pins) == 0:
+            if self.facts.pin_bounds is None:
                 return False
-            x_pos = [int(pin['posx']) for pin in pins]
-            y_pos = [int(pin['posy']) for pin in pins]
-            x_min = min(x_pos)
-            x_max = max(x_pos)
-            y_min = min(y_pos)
-            y_max = max(y_pos)
+            x_min, y_min, x_max, y_max = self.facts.pin_bounds
 
             # Center point average
             x = (x_min + x_max) / 2
@@ -14,8 +14,9 @@ class Rule(KLCRule):
         self.violating_pins = []
         err = False
         for pin in self.component.pins:
-            posx = int(pin['posx'])
-            posy = int(pin['posy'])
+            values = self.component.getPinValues(pin)
+            posx = values.posx
+            posy = values.posy
             if (posx % gridspacing) != 0 or (posy % gridspacing) != 0:
                 self.violating_pins.append(pin)
                 if not err:
@@ -26,8 +27,8 @@ class Rule(KLCRule):
         return len(self.violating_pins) > 0
 
     def checkDuplicatePins(self):
-        # List of lists of pins
-        pin_lists = []
+        # Lists of pins, by key
+        pin_lists = {}
 
         # look for duplicate pin numbers
         # For a pin to be considered a duplicate, it must have:
@@ -38,26 +39,11 @@ class Rule(KLCRule):
         keys = ['num', 'unit', 'convert']
 
         for pin in self.component.pins:
-
-            found = False
-
-            for i, pin_list in enumerate(pin_lists):
-
-                # Compare against first item
-                p_test = pin_list[0]
-
-                # Test each key
-                if all([pin[k] == p_test[k] for k in keys]):
-                    found = True
-                    pin_lists[i].append(pin)
-                    break
-
-            if not found:
-                pin_lists.append([pin])
+            pin_lists.setdefault(tuple(pin[k] for k in keys), []).append(pin)
 
         duplicate = False
 
-        for pin_list in pin_lists:
+        for pin_list in pin_lists.values():
             # Look for duplicate groups
             if len(pin_list) > 1:
                 duplicate = True
@@ -72,7 +58,7 @@ class Rule(KLCRule):
         self.violating_pins = []
 
         for pin in self.component.pins:
-            length = int(pin['length'])
+            length = self.component.getPinValues(pin).length
 
             err = False
 
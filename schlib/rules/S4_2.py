@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 
 from rules.rule import *
-import re
 
 
 class Rule(KLCRule):
@@ -18,10 +17,11 @@ class Rule(KLCRule):
 
         first = True
 
+        matches = [self.facts.pinsMatching([gnd]) for gnd in GND]
+
         for pin in self.component.pins:
-            name = str(pin['name'].lower())
-            for gnd in GND:
-                if re.search(gnd, name, flags=re.IGNORECASE) is not None:
+            for matching in matches:
+                if id(pin) in matching:
                     # Pin orientation should be "up"
                     if (not self.component.isPowerSymbol()) and (not pin['direction'] == 'U'):
                         if first:
@@ -36,10 +36,11 @@ class Rule(KLCRule):
 
         first = True
 
+        matches = [self.facts.pinsMatching([pwr]) for pwr in PWR]
+
         for pin in self.component.pins:
-            name = str(pin['name'].lower())
-            for pwr in PWR:
-                if re.search(pwr, name, flags=re.IGNORECASE) is not None:
+            for matching in matches:
+                if id(pin) in matching:
                     # Pin orientation should be "down"
                     if (not self.component.isPowerSymbol()) and not pin['direction'] == 'D':
                         if first:
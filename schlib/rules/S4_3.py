@@ -19,8 +19,7 @@ class Rule(KLCRule):
         self.fix_make_passive = set()
 
     def stackStr(self, stack):
-        multi_unit = int(self.component.definition['unit_count']) > 1
-        unit_str = " (unit {u})".format(u=stack['u']) if multi_unit else ""
+        unit_str = " (unit {u})".format(u=stack['u']) if self.facts.multi_unit else ""
 
         # WHY are pins flipped vertically? Mega sad face :(
         return "Pinstack @ ({x},{y}){u}".format(
@@ -29,9 +28,7 @@ class Rule(KLCRule):
             u=unit_str)
 
     def pinStr(self, pin):
-        multi_unit = int(self.component.definition['unit_count']) > 1
-
-        if multi_unit:
+        if self.facts.multi_unit:
             unit = pin['unit']
         else:
             unit = None
@@ -46,32 +43,15 @@ class Rule(KLCRule):
 
         pin_locations = []
 
-        for pin in self.component.pins:
-
-            # To be "identical", all following properties much be the same
-
-            pinx = pin['posx']     # x coordinate
-            piny = pin['posy']     # y coordinate
-            pinu = pin['unit']     # unit (for multi-unit parts)
-            pinc = pin['convert']  # convert (de morgan)
-
-            dupe = False
-
-            for loc in pin_locations:
-
-                locx = loc['x']
-                locy = loc['y']
-                locu = loc['u']
-                locc = loc['c']
-
-                if pinx == locx and piny == locy and pinu == locu and pinc == locc:
-                    loc['pins'].append(pin)
-                    dupe = True
-
-            if not dupe:
-                new_loc = {'x': pinx, 'y': piny, 'u': pinu, 'c': pinc}
-                new_loc['pins'] = [pin]
-                pin_locations.append(new_loc)
+        # To be "identical", pins must have the same x and y coordinates,
+        # unit (for multi-unit parts) and convert (de morgan)
+        for (pinx, piny, pinu, pinc), pins in self.component.getPinIndex('position').items():
+            # a single pin is not a stack
+            if len(pins) == 1:
+                continue
+            new_loc = {'x': pinx, 'y': piny, 'u': pinu, 'c': pinc}
+            new_loc['pins'] = list(pins)
+            pin_locations.append(new_loc)
 
         err = False
 
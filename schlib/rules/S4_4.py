@@ -31,15 +31,6 @@ class Rule(KLCRule):
         "B": BIDIR_PINS,
         }
 
-    # check if a pin name fits within a list of possible pins (using regex testing)
-    def test(self, pinName, nameList):
-
-        for name in nameList:
-            if re.search(name, pinName, flags=re.IGNORECASE) is not None:
-                return True
-
-        return False
-
     """
     Create the methods check and fix to use with the kicad lib files.
     """
@@ -51,8 +42,9 @@ class Rule(KLCRule):
 
         self.power_errors = []
 
+        power_inputs = self.facts.pinsMatching(self.POWER_INPUTS)
+
         for pin in pins:
-            name = pin['name'].lower()
             etype = pin['electrical_type']
 
             inSpecialStack = False
@@ -61,7 +53,7 @@ class Rule(KLCRule):
                 inSpecialStack = pin['num'] in self.component.padInSpecialPowerStack
                 Rule43NotExecuted = False
 
-            if self.test(name.lower(), self.POWER_INPUTS) and (not etype.lower() == 'w') and (not inSpecialStack):
+            if id(pin) in power_inputs and (not etype.lower() == 'w') and (not inSpecialStack):
                 if len(self.power_errors) == 0:
                     self.error("Power pins should be of type POWER INPUT or POWER OUTPUT")
                     if Rule43NotExecuted:
@@ -78,16 +70,14 @@ class Rule(KLCRule):
 
         self.suggestions = []
 
+        matches = [(pin_type, self.facts.pinsMatching(tests)) for pin_type, tests in self.warning_tests.items()]
+
         for pin in pins:
-            name = pin['name'].lower()
             etype = pin['electrical_type']
 
-            for pin_type in self.warning_tests.keys():
-                pins = self.warning_tests[pin_type]
-
-                tests = self.warning_tests[pin_type]
+            for pin_type, matching in matches:
 
-                if self.test(name, tests):
+                if id(pin) in matching:
 
                     if not pin_type == etype:
                         if len(self.suggestions) == 0:
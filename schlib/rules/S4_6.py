@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 
 from rules.rule import *
-import re
 
 
 class Rule(KLCRule):
@@ -9,15 +8,6 @@ class Rule(KLCRule):
     # No-connect pins should be "N"
     NC_PINS = ['^nc$', '^dnc$', '^n\.c\.$']
 
-    # check if a pin name fits within a list of possible pins (using regex testing)
-    def test(self, pinName, nameList):
-
-        for name in nameList:
-            if re.search(name, pinName, flags=re.IGNORECASE) is not None:
-                return True
-
-        return False
-
     """
     Create the methods check and fix to use with the kicad lib files.
     """
@@ -29,15 +19,16 @@ class Rule(KLCRule):
         self.invisible_errors = []
         self.type_errors = []
 
+        nc_pins = self.facts.pinsMatching(self.NC_PINS)
+
         for pin in pins:
 
-            name = pin['name'].lower()
             etype = pin['electrical_type']
 
             visible = not (pin['pin_type'].startswith('N'))
 
             # Check NC pins
-            if self.test(name.lower(), self.NC_PINS) or etype == 'N':
+            if id(pin) in nc_pins or etype == 'N':
 
                 # NC pins should be of type N
                 if not etype == 'N':  # Not set to NC
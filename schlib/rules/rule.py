@@ -85,3 +85,31 @@ class KLCRule(KLCRuleBase):
         KLCRuleBase.__init__(self, description)
 
         self.component = component
+
+    @property
+    def facts(self):
+        # values derived from the component, shared by all the rules
+        # (see ComponentFacts)
+        return self.component.getFacts()
+
+    def recheck(self):
+        # the fix may have modified the component
+        self.component.changed()
+
+        KLCRuleBase.recheck(self)
+
+class KLCLibraryRule(KLCRuleBase):
+    """
+    A base class to represent a KLC rule which applies to a whole library
+    (e.g. to its files) and is checked once per library
+    """
+
+    verbosity = 0
+
+    scope = Scope.LIBRARY
+
+    def __init__(self, library, description):
+
+        KLCRuleBase.__init__(self, description)
+
+        self.library = library
@@ -1,10 +1,68 @@
 # -*- coding: utf-8 -*-
 
-import sys, shlex
-import os.path
-from collections import OrderedDict
+import sys, re, io
+import os, os.path
+import pickle
+from collections import OrderedDict, namedtuple
+from functools import partial, cached_property
 import hashlib
 
+common = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+if not common in sys.path:
+    sys.path.append(common)
+
+from atomicwrite import atomicWrite
+from filecache import FileCache, defaultCacheDir
+
+# Bump when the parsed state of SchLib, Component or Documentation changes,
+# to invalidate cached libraries
+PARSER_VERSION = 1
+
+# On-disk cache of parsed libraries (see enable_cache)
+_cache = None
+
+# A token is either a quoted string (kept with its quotes, and ending at the
+# closing quote) or a run of non-whitespace characters not starting with a
+# quote. These are the rules of shlex in non-POSIX mode with
+# whitespace_split=True and '"' as the only quote character. A lone quote is
+# only matched when it is not closed.
+_token_regex = re.compile(r'"[^"]*"|[^ \t\r\n"][^ \t\r\n]*|"')
+
+def _splitLine(line):
+    tokens = _token_regex.findall(line)
+    if '"' in line and '"' in tokens:
+        raise ValueError("No closing quotation")
+    return tokens
+
+def enable_cache(directory, max_size=None):
+    """
+    Cache the libraries parsed by SchLib (with their documentation) in
+    directory, so that unchanged libraries are not parsed again in later
+    runs
+    """
+    global _cache
+    directory = os.path.join(directory, 'schlib')
+    dumps = partial(pickle.dumps, protocol=pickle.HIGHEST_PROTOCOL)
+    if max_size is None:
+        _cache = FileCache(directory, PARSER_VERSION, dumps=dumps, loads=pickle.loads)
+    else:
+        _cache = FileCache(directory, PARSER_VERSION, max_size=max_size, dumps=dumps, loads=pickle.loads)
+
+def disable_cache():
+    global _cache
+    _cache = None
+
+if defaultCacheDir():
+    enable_cache(defaultCacheDir())
+
+def _writeFile(filename, chunks):
+    """
+    Write the given strings to a file, atomically and only when the
+    content changed (see atomicWrite). Return True if the file was written
+    """
+    return atomicWrite(filename, lambda f: f.writelines(chunks), only_if_changed=True)
+
 class Documentation(object):
     """
     A class to parse documentation files (dcm) of Schematic Libraries Files Format of the KiCad
@@ -43,82 +101,212 @@ class Documentation(object):
                 self.__parse()
 
     def __parse(self):
-        f = open(self.filename, 'r')
-        self.header = [f.readline()]
-
-        if self.header and not self.line_keys['header'] in self.header[0]:
-            self.header=None
-            sys.stderr.write("'{fn}' is not a KiCad Documentation Library File\n".format(fn=self.filename))
-            return False
-
-        name = None
-        f.seek(0)
-
-        checksum_data = ''
-
-        for line in f.readlines():
-            checksum_data += line.strip()
-            line = line.replace('\n', '')
-            if line.startswith(Documentation.line_keys['start']):
-                name = line[5:].strip()
-                keywords = None
-                description = None
-                datasheet = None
-            elif line.startswith(Documentation.line_keys['description']):
-                description = line[2:]
-            elif line.startswith(Documentation.line_keys['keywords']):
-                keywords = line[2:]
-            elif line.startswith(Documentation.line_keys['datasheet']):
-                datasheet = line[2:]
-            elif line.startswith(Documentation.line_keys['end']):
-                self.components[name] = OrderedDict([('description',description), ('keywords',keywords), ('datasheet',datasheet)])
-            #FIXME: we do not handle comments except separators around components
-        f.close()
-
-        try:
-            md5 = hashlib.md5(checksum_data.encode('utf-8'))
-        except UnicodeDecodeError:
-            md5 = hashlib.md5(checksum_data)
+        # a single pass over the lines, dispatched on their first two
+        # characters ('D ', 'K ', 'F ', '$C'MP or '$E'NDCMP)
+        with open(self.filename, 'r') as f:
+            self.header = [f.readline()]
+
+            if self.header and not self.line_keys['header'] in self.header[0]:
+                self.header=None
+                sys.stderr.write("'{fn}' is not a KiCad Documentation Library File\n".format(fn=self.filename))
+                return False
+
+            md5 = hashlib.md5(self.header[0].strip().encode('utf-8'))
+
+            name = None
+            for line in f:
+                md5.update(line.strip().encode('utf-8'))
+                line = line.replace('\n', '')
+                tag = line[:2]
+                if tag == 'D ':
+                    description = line[2:]
+                elif tag == 'K ':
+                    keywords = line[2:]
+                elif tag == 'F ':
+                    datasheet = line[2:]
+                elif tag == '$C' and line.startswith(Documentation.line_keys['start']):
+                    name = line[5:].strip()
+                    keywords = None
+                    description = None
+                    datasheet = None
+                elif tag == '$E' and line.startswith(Documentation.line_keys['end']):
+                    self.components[name] = OrderedDict([('description',description), ('keywords',keywords), ('datasheet',datasheet)])
+                #FIXME: we do not handle comments except separators around components
 
         self.checksum = md5.hexdigest()
 
         return True
 
     def save(self, filename=None):
-        if not self.validFile: return False
+        """
+        Write the documentation, the components sorted by name. The file is
+        written as _writeFile does (atomically, only if its content changed)
+        """
+        if not self.validFile or self.header is None: return False
 
         if not filename: filename = self.filename
 
-        to_write=self.header
+        _writeFile(filename, self.__lines())
+
+    def __lines(self):
+        for line in self.header:
+            yield line
 
         # Ensure that items are written in alphabetical order
-        items = sorted(self.components.items(), key = lambda item: item[0])
-
-        for name,doc in items:
-            to_write.append('#\n')#just spacer (no even in dcm format specification, but used everywhere)
-            to_write.append(self.line_keys['start']+name+'\n')
-            for key in doc.keys():
-                if(doc[key]!=None):
-                    to_write.append( self.line_keys[key]+doc[key]+'\n')
-            to_write.append(self.line_keys['end']+'\n')
-        to_write.append("#\n")#again, spacer^^
-        to_write.append("#End Doc Library\n")
-
-        f = open(filename, 'w', newline='\n')
-        f.writelines(to_write)
-        f.close()
+        for name in sorted(self.components):
+            doc = self.components[name]
+            yield '#\n'#just spacer (no even in dcm format specification, but used everywhere)
+            yield self.line_keys['start'] + name + '\n'
+            for key, value in doc.items():
+                if value is not None:
+                    yield self.line_keys[key] + value + '\n'
+            yield self.line_keys['end'] + '\n'
+
+        yield '#\n'#again, spacer^^
+        yield '#End Doc Library\n'
 
     def remove(self, name):
-        if name in self.components.keys():#delete only if it exists
-            del self.components[name]
+        # delete only if it exists
+        self.components.pop(name, None)
 
     def add(self, name, doc):
         if doc:#do not create empty records
             self.components[name]=doc
 
+def _fingerprint(checksum, docs):
+    # checksum of the component lines, followed by the dcm lines of the
+    # documentation of the component and of its aliases
+    md5 = hashlib.md5(checksum.encode('utf-8'))
+    for name, doc in docs:
+        if not doc:
+            continue
+        md5.update((Documentation.line_keys['start'] + name + '\n').encode('utf-8'))
+        for key in ['description', 'keywords', 'datasheet']:
+            if doc.get(key) is not None:
+                md5.update((Documentation.line_keys[key] + doc[key] + '\n').encode('utf-8'))
+        md5.update((Documentation.line_keys['end'] + '\n').encode('utf-8'))
+    return md5.hexdigest()
+
+class _PackedAttribute(object):
+    """
+    An attribute of a Component holding dicts. When the component was
+    unpickled, these attributes are built from their packed values on
+    first access (see Component.__getstate__)
+    """
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        instance._unpack()
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+# numeric values of a pin (see Component.getPinValues)
+PinValues = namedtuple('PinValues', ['posx', 'posy', 'length', 'num_text_size', 'name_text_size'])
+
+class ComponentFacts(object):
+    """
+    Values derived from a component which several KLC rules need. They are
+    computed on first use and shared by all the rules checking the
+    component (see Component.getFacts), until the component is modified.
+    """
+    def __init__(self, component):
+        self.component = component
+        self._matches = {}
+
+    @cached_property
+    def unit_count(self):
+        return int(self.component.definition['unit_count'])
+
+    @cached_property
+    def multi_unit(self):
+        return self.unit_count > 1
+
+    @cached_property
+    def is_non_bom(self):
+        return self.component.reference.startswith('#')
+
+    @cached_property
+    def is_power(self):
+        pins = self.component.pins
+        return (self.component.reference=='#PWR') and (len(pins)==1) and (pins[0]['electrical_type'].lower()=='w')
+
+    @cached_property
+    def is_graphic(self):
+        return self.is_non_bom and len(self.component.pins)==0
+
+    @cached_property
+    def filled_rectangles(self):
+        return [rect for rect in self.component.draw['rectangles'] if rect['fill'] == 'f']
+
+    @cached_property
+    def rectangle_bounds(self):
+        # (x_min, y_min, x_max, y_max) of each rectangle
+        bounds = []
+        for rect in self.component.draw['rectangles']:
+            x = (int(rect['startx']), int(rect['endx']))
+            y = (int(rect['starty']), int(rect['endy']))
+            bounds.append((min(x), min(y), max(x), max(y)))
+        return bounds
+
+    @cached_property
+    def pin_bounds(self):
+        # (x_min, y_min, x_max, y_max) of the pin positions, None without pins
+        pins = self.component.pins
+        if len(pins) == 0:
+            return None
+        values = [self.component.getPinValues(pin) for pin in pins]
+        x = [v.posx for v in values]
+        y = [v.posy for v in values]
+        return (min(x), min(y), max(x), max(y))
+
+    @cached_property
+    def is_small(self):
+        # heuristics, which tries to determine whether this is a "small" component (resistor, capacitor, LED, diode, transistor, ...)
+        n_pins = len(self.component.pins)
+        if n_pins<=2:
+            return True
+
+        # if there is no filled rectangle as symbol outline and we have 3 or 4 pins, we assume this
+        # is a small symbol
+        return n_pins>=3 and n_pins<=4 and len(self.filled_rectangles) == 0
+
+    @cached_property
+    def pin_names(self):
+        # lower case names of the pins, in pin order
+        return [pin['name'].lower() for pin in self.component.pins]
+
+    def pinsMatching(self, patterns):
+        """
+        Return the ids of the pins whose name matches one of the regular
+        expressions (case insensitive)
+        """
+        key = tuple(patterns)
+        ids = self._matches.get(key)
+        if ids is None:
+            regexes = [re.compile(pattern, re.IGNORECASE) for pattern in key]
+            ids = set()
+            for pin, name in zip(self.component.pins, self.pin_names):
+                for regex in regexes:
+                    if regex.search(name) is not None:
+                        ids.add(id(pin))
+                        break
+            self._matches[key] = ids
+        return ids
+
 class Component(object):
     """
     A class to parse components of Schematic Libraries Files Format of the KiCad
+
+    Pin lookups and facts (see getFacts) are built on first use. Code
+    modifying the component must call changed() afterwards (KLCRule.recheck
+    does it after a fix): the pin indexes and the facts are dropped, and
+    SchLib.save writes the component again instead of copying its lines
+    from the library file.
     """
 
     _DEF_KEYS = ['name','reference','unused','text_offset','draw_pinnumber','draw_pinname','unit_count','units_locked','option_flag']
@@ -136,6 +324,13 @@ class Component(object):
 
     _KEYS = {'DEF':_DEF_KEYS, 'F0':_F0_KEYS, 'F':_FN_KEYS,
              'A':_ARC_KEYS, 'C':_CIRCLE_KEYS, 'P':_POLY_KEYS, 'S':_RECT_KEYS, 'T':_TEXT_KEYS, 'X':_PIN_KEYS}
+
+    definition = _PackedAttribute()
+    fields = _PackedAttribute()
+    draw = _PackedAttribute()
+    drawOrdered = _PackedAttribute()
+    pins = _PackedAttribute()
+
     def __init__(self, data, comments, filename, documentation):
         self.comments = comments
         self.fplist = []
@@ -146,18 +341,13 @@ class Component(object):
         building_draw = False
         building_fields = False
 
-        checksum_data = ''
+        md5 = hashlib.md5()
 
         self.resetDraw()
 
         for line in data:
-            checksum_data += line.strip()
-            line = line.replace('\n', '')
-            s = shlex.shlex(line)
-            s.whitespace_split = True
-            s.commenters = ''
-            s.quotes = '"'
-            line = list(s)
+            md5.update(line.strip().encode('utf-8'))
+            line = _splitLine(line.replace('\n', ''))
 
             if len(line) == 0:
                 continue
@@ -230,13 +420,14 @@ class Component(object):
                         values = line[1:] + ['' for n in range(len(self._FN_KEYS) - len(line[1:]))]
                         self.fields.append(dict(zip(self._FN_KEYS,values)))
 
-        #perform checksum calculation
-        try:
-            md5 = hashlib.md5(checksum_data.encode('utf-8'))
-        except UnicodeDecodeError:
-            md5 = hashlib.md5(checksum_data)
         self.checksum = md5.hexdigest()
 
+        # lines of the component as read, written as they are while the
+        # component is not modified
+        self._source = ''.join(comments + data)
+        if not self._source.endswith('\n'):
+            self._source += '\n'
+
         # define some shortcuts
         self.name = self.definition['name']
         self.reference = self.definition['reference']
@@ -245,6 +436,8 @@ class Component(object):
         # get documentation
         self.documentation = self.getDocumentation(documentation,self.name)
 
+        self.pinsChanged()
+
     def resetDraw(self):
         self.draw = {
                     'arcs':[],
@@ -255,7 +448,94 @@ class Component(object):
                     'pins':[]
                 }
 
-    def getDocumentation(self,documentation,name):
+    def __getstate__(self):
+        # The pin caches and the facts refer to pins by id(), they are not
+        # pickled. The dicts are pickled as tuples of values, with one tuple
+        # of keys for all the dicts having the same keys: this is much
+        # smaller and faster to unpickle, the dicts are built again on
+        # first access.
+        state = self.__dict__.copy()
+        state.pop('_pin_indexes', None)
+        state.pop('_pin_values', None)
+        state.pop('_facts', None)
+
+        if '_packed' in state:
+            return state
+
+        keys = {}
+        values = []
+        indexes = {}
+
+        def pack(d):
+            i = indexes.get(id(d))
+            if i is None:
+                k = tuple(d)
+                k = keys.setdefault(k, k)
+                i = indexes[id(d)] = len(values)
+                values.append((k, tuple(d.values())))
+            return i
+
+        try:
+            packed = {}
+            if 'definition' in state:
+                packed['definition'] = pack(state['definition'])
+            if 'fields' in state:
+                packed['fields'] = [pack(f) for f in state['fields']]
+            if 'draw' in state:
+                packed['draw'] = dict((k, [pack(e) for e in v]) for k, v in state['draw'].items())
+            if 'drawOrdered' in state:
+                packed['drawOrdered'] = [(t, pack(e)) for t, e in state['drawOrdered']]
+            if 'pins' in state:
+                # shortcut to draw['pins']
+                if state['pins'] is state.get('draw', {}).get('pins'):
+                    packed['pins'] = None
+                else:
+                    packed['pins'] = [pack(pin) for pin in state['pins']]
+        except (TypeError, AttributeError, ValueError):
+            # not the structure of a parsed component, pickled as it is
+            return state
+
+        for name in packed:
+            del state[name]
+        state['_packed'] = (values, packed)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pinsChanged()
+
+    def _unpack(self):
+        packed = self.__dict__.pop('_packed', None)
+        if packed is None:
+            return
+
+        values, packed = packed
+        dicts = [dict(zip(k, v)) for k, v in values]
+
+        if 'definition' in packed:
+            self.definition = dicts[packed['definition']]
+        if 'fields' in packed:
+            self.fields = [dicts[i] for i in packed['fields']]
+        if 'draw' in packed:
+            self.draw = dict((k, [dicts[i] for i in v]) for k, v in packed['draw'].items())
+        if 'drawOrdered' in packed:
+            self.drawOrdered = [[t, dicts[i]] for t, i in packed['drawOrdered']]
+        if 'pins' in packed:
+            if packed['pins'] is None:
+                self.pins = self.draw['pins']
+            else:
+                self.pins = [dicts[i] for i in packed['pins']]
+
+    def getFingerprint(self):
+        """
+        Return a fingerprint of the component as read from the library:
+        its lines, its documentation and the documentation of its aliases
+        """
+        docs = [(self.name, self.documentation)] + list(self.aliases.items())
+        return _fingerprint(self.checksum, docs)
+
+    @staticmethod
+    def getDocumentation(documentation,name):
         try:
             if name.startswith('~'):
                 return documentation.components[name[1:(len(name))] ]
@@ -264,82 +544,160 @@ class Component(object):
         except KeyError:
             return {}
 
-    def getPinsByName(self, name):
-        pins = []
-        for pin in self.pins:
-            if pin['name'] == name:
-                pins.append(pin)
+    def changed(self):
+        """
+        Mark the component as modified
+        """
+        self._source = None
+        self.pinsChanged()
+
+    def isModified(self):
+        return self._source is None
+
+    def pinsChanged(self):
+        """
+        Drop the pin indexes and values and the facts, they are built again
+        on next use
+        """
+        self._pin_indexes = None
+        self._pin_values = {}
+        self._facts = None
+
+    def getFacts(self):
+        """
+        Return the ComponentFacts of the component
+        """
+        if self._facts is None:
+            self._facts = ComponentFacts(self)
+        return self._facts
+
+    def getPinIndex(self, key):
+        """
+        Return a dict of lists of pins (in pin order), by:
+        - 'num', 'name', 'direction' or 'electrical_type'
+        - 'unit': (unit, convert)
+        - 'position': (posx, posy, unit, convert)
+        Keys are the strings of the library file. The dict must not be
+        modified.
+        """
+        if self._pin_indexes is None:
+            indexes = {'num': {}, 'name': {}, 'direction': {}, 'electrical_type': {}, 'unit': {}, 'position': {}}
+            for pin in self.pins:
+                for k in ['num', 'name', 'direction', 'electrical_type']:
+                    indexes[k].setdefault(pin[k], []).append(pin)
+                indexes['unit'].setdefault((pin['unit'], pin['convert']), []).append(pin)
+                indexes['position'].setdefault((pin['posx'], pin['posy'], pin['unit'], pin['convert']), []).append(pin)
+            self._pin_indexes = indexes
+
+        return self._pin_indexes[key]
+
+    def getPinValues(self, pin):
+        """
+        Return the numeric values (PinValues) of a pin, parsed once
+        """
+        values = self._pin_values.get(id(pin))
+        if values is None:
+            values = PinValues(int(pin['posx']), int(pin['posy']), int(pin['length']),
+                               int(pin['num_text_size']), int(pin['name_text_size']))
+            self._pin_values[id(pin)] = values
+        return values
 
-        return pins
+    def getPinsByName(self, name):
+        return list(self.getPinIndex('name').get(name, []))
 
     def getPinByNumber(self, num):
-        for pin in self.draw['pins']:
-            if pin['num'] == str(num):
-                return pin
+        pins = self.getPinIndex('num').get(str(num))
+        return pins[0] if pins else None
+
+    def getPinsByUnit(self, unit, convert):
+        return list(self.getPinIndex('unit').get((str(unit), str(convert)), []))
 
-        return None
+    def getPinsAt(self, posx, posy, unit, convert):
+        return list(self.getPinIndex('position').get((str(posx), str(posy), str(unit), str(convert)), []))
 
     def filterPins(self, name=None, direction=None, electrical_type=None):
-        pins = []
+        found = []
+        for key, value in [('name', name), ('direction', direction), ('electrical_type', electrical_type)]:
+            if value:
+                found.append(self.getPinIndex(key).get(value, []))
 
-        for pin in self.pins:
-            if ((name and pin['name'] == name) or
-                (direction and pin['direction'] == direction) or
-                (electrical_type and pin['electrical_type'] == electrical_type)):
-                pins.append(pin)
+        if len(found) == 1:
+            return list(found[0])
 
-        return pins
+        # keep the pin order for several criteria
+        found = set(id(pin) for pins in found for pin in pins)
+        return [pin for pin in self.pins if id(pin) in found]
 
     def isNonBOMSymbol(self):
-        return self.reference.startswith('#')
+        return self.getFacts().is_non_bom
 
     def isPowerSymbol(self):
-        return (self.reference=='#PWR') and (len(self.pins)==1) and (self.pins[0]['electrical_type'].lower()=='w')
+        return self.getFacts().is_power
 
     def isPossiblyPowerSymbol(self):
         return (self.reference=='#PWR')
 
     def isGraphicSymbol(self):
-        return self.isNonBOMSymbol() and len(self.pins)==0
+        return self.getFacts().is_graphic
 
     # heuristics, which tries to determine whether this is a "small" component (resistor, capacitor, LED, diode, transistor, ...)
     def isSmallComponentHeuristics(self):
-        if len(self.pins)<=2:
-            return True;
-
-        # If there is only a single filled rectangle, we assume that it is the
-        # main symbol outline.
-        drawing = self.draw
-        filled_rects = [rect for rect in drawing['rectangles']
-                        if rect['fill'] == 'f']
-        
-        # if there is no filled rectangle as symbol outline and we have 3 or 4 pins, we assume this 
-        # is a small symbol
-        if len(self.pins)>=3 and len(self.pins)<=4 and len(filled_rects) == 0:
-            return True;
-        
-        return False;
-
-
+        return self.getFacts().is_small
 
+class _ComponentBlock(object):
+    """
+    A component of a lazy SchLib which is not parsed yet: the byte range of
+    its lines in the library file (including the comments before it), its
+    name, its aliases, its checksum and its position in the component list
+    """
+    def __init__(self, name, aliases, start, end, checksum, index):
+        self.name = name
+        self.aliases = aliases
+        self.start = start
+        self.end = end
+        self.checksum = checksum
+        self.index = index
 
 class SchLib(object):
     """
     A class to parse Schematic Libraries Files Format of the KiCad
+
+    With lazy=True the library file is only scanned for the position, name
+    and aliases of each component. A Component is parsed when it is first
+    accessed (lib[name], getComponentByName, getComponent, ...); the
+    components property parses all of them. Components which were never accessed are
+    saved as they are in the file.
+
+    Components are indexed by name and by alias, lookups do not scan the
+    component list.
     """
 
     line_keys={
         'header':'EESchema-LIBRARY',
     }
 
-    def __init__(self, filename, create=False):
+    def __init__(self, filename, create=False, lazy=False):
         self.filename = filename
         self.header = None
-        self.components = []
+        self._components = []
         self.validFile = False
 
+        # number of components not parsed yet (lazy mode)
+        self._unparsed = 0
+
+        # first component of each name and owner of each alias
+        self._names = {}
+        self._aliases = {}
+
         self.checksum = ""
 
+        # libraries parsed in an earlier run are restored from the cache
+        key = None
+        if _cache is not None and not create and not lazy and os.path.isfile(self.filename):
+            key = _cache.key([self.filename, self.libToDcmFilename(self.filename)])
+            if self.__restore(_cache.get(key)):
+                return
+
         self.documentation = Documentation(self.libToDcmFilename(self.filename), create)
 
         if create:
@@ -356,7 +714,99 @@ class SchLib(object):
                 return
             else:
                 self.validFile = True
-                self.__parse()
+                if lazy:
+                    self.__scan()
+                elif self.__parse() and key is not None:
+                    # libraries which were reported as invalid are not cached,
+                    # to report them again
+                    if self.documentation.validFile and self.documentation.header is not None:
+                        _cache.put(key, (self.header, self._components, self.checksum, self.documentation))
+
+    def __restore(self, cached):
+        if cached is None:
+            return False
+
+        self.header, self._components, self.checksum, self.documentation = cached
+        self.validFile = True
+
+        # the same files may have been cached under another name
+        self.documentation.filename = self.libToDcmFilename(self.filename)
+        for component in self._components:
+            component.lib_filename = self.filename
+            component.dcm_filename = self.documentation.filename
+
+        self.__reindex()
+        return True
+
+    @property
+    def components(self):
+        # all components must be parsed to be listed
+        if self._unparsed:
+            self.__load([i for i, c in enumerate(self._components) if type(c) == _ComponentBlock])
+        return self._components
+
+    def __getitem__(self, name):
+        component = self.getComponentByName(name)
+        if component is None:
+            raise KeyError(name)
+        return component
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._components)
+
+    def keys(self):
+        """
+        Return the names of the components, in file order
+        (without parsing the components of a lazy library)
+        """
+        return [component.name for component in self._components]
+
+    def get(self, name, default=None):
+        component = self.getComponentByName(name)
+        return default if component is None else component
+
+    def resolve(self, name):
+        """
+        Return the component which has the given name, or else the
+        component which has it as an alias (None if there is none)
+        """
+        component = self._names.get(name)
+        if component is None:
+            component = self._aliases.get(name)
+        if type(component) == _ComponentBlock:
+            component = self.__load([component.index])[0]
+        return component
+
+    def __getstate__(self):
+        # the indexes are built again after unpickling
+        state = self.__dict__.copy()
+        del state['_names']
+        del state['_aliases']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__reindex()
+
+    def __index(self, component):
+        self._names.setdefault(component.name, component)
+        for alias in component.aliases:
+            self._aliases.setdefault(alias, component)
+
+    def __reindex(self):
+        self._names = {}
+        self._aliases = {}
+        for i, component in enumerate(self._components):
+            # the blocks after a removed component have moved
+            if type(component) == _ComponentBlock:
+                component.index = i
+            self.__index(component)
 
     def libToDcmFilename(self,filename):
         dir_path = os.path.dirname(os.path.realpath(filename))
@@ -366,23 +816,34 @@ class SchLib(object):
     def __parse(self):
         f = open(self.filename, 'r')
 
-        checksum_data = ""
-
         self.header = [f.readline()]
 
-        checksum_data += self.header[0]
+        md5 = hashlib.md5(self.header[0].encode('utf-8'))
 
         if self.header and not SchLib.line_keys['header'] in self.header[0]:
             sys.stderr.write("'{fn}' is not a KiCad Schematic Library File\n".format(fn=self.filename))
             return False
 
         self.header.append(f.readline())
+
+        lines = f.readlines()
+        f.close()
+
+        for line in lines:
+            md5.update(line.strip().encode('utf-8'))
+
+        self._components = list(self.__readComponents(lines))
+        self.__reindex()
+
+        self.checksum = md5.hexdigest()
+
+        return True
+
+    def __readComponents(self, lines):
         building_component = False
 
         comments = []
-        for line in f.readlines():
-
-            checksum_data += line.strip()
+        for line in lines:
 
             if line.startswith('#'):
                 comments.append(line)
@@ -396,19 +857,98 @@ class SchLib(object):
                 component_data.append(line)
                 if line.startswith('ENDDEF'):
                     building_component = False
-                    self.components.append(Component(component_data, comments, self.filename, self.documentation))
+                    yield Component(component_data, comments, self.filename, self.documentation)
                     comments = []
+
+    def __scan(self):
+        # same as __parse, but components are only located (see _ComponentBlock)
+        f = open(self.filename, 'rb')
+
+        self.header = [f.readline().decode('utf-8').replace('\r\n', '\n')]
+
+        md5 = hashlib.md5(self.header[0].encode('utf-8'))
+
+        if self.header and not SchLib.line_keys['header'] in self.header[0]:
+            f.close()
+            sys.stderr.write("'{fn}' is not a KiCad Schematic Library File\n".format(fn=self.filename))
+            return False
+
+        self.header.append(f.readline().decode('utf-8').replace('\r\n', '\n'))
+        building_component = False
+
+        # a block starts after the end of the previous one
+        start = offset = f.tell()
+        for line in f:
+            end = offset + len(line)
+            line = line.decode('utf-8')
+
+            stripped = line.strip().encode('utf-8')
+            md5.update(stripped)
+
+            if line.startswith('#'):
+                pass
+
+            elif line.startswith('DEF'):
+                building_component = True
+                name = _splitLine(line)[1]
+                aliases = OrderedDict()
+                # same as Component.checksum
+                component_md5 = hashlib.md5(stripped)
+
+            elif building_component:
+                component_md5.update(stripped)
+
+                if line.startswith('ALIAS'):
+                    tokens = _splitLine(line)
+                    if tokens[0] == 'ALIAS':
+                        for alias in tokens[1:]:
+                            aliases[alias] = None
+
+                elif line.startswith('ENDDEF'):
+                    building_component = False
+                    block = _ComponentBlock(name, list(aliases), start, end, component_md5.hexdigest(), len(self._components))
+                    self._components.append(block)
+                    self.__index(block)
+                    self._unparsed += 1
+                    start = end
+
+            offset = end
         f.close()
 
-        #perform checksum calculation
-        try:
-            md5 = hashlib.md5(checksum_data.encode('utf-8'))
-        except UnicodeDecodeError:
-            md5 = hashlib.md5(checksum_data)
         self.checksum = md5.hexdigest()
 
         return True
 
+    def __readBlocks(self, blocks):
+        # return the text of the given blocks, only their bytes are read
+        texts = []
+        with open(self.filename, 'rb') as f:
+            for block in blocks:
+                f.seek(block.start)
+                text = f.read(block.end - block.start).decode('utf-8')
+                texts.append(text.replace('\r\n', '\n').replace('\r', '\n'))
+        return texts
+
+    def __load(self, indexes):
+        # parse the blocks at the given positions of the component list,
+        # return the parsed components
+        blocks = [self._components[i] for i in indexes]
+        components = []
+        for i, block, text in zip(indexes, blocks, self.__readBlocks(blocks)):
+            component = next(self.__readComponents(io.StringIO(text)))
+            self._components[i] = component
+            self._unparsed -= 1
+
+            # the indexes must point to the component now
+            if self._names.get(block.name) is block:
+                self._names[block.name] = component
+            for alias in block.aliases:
+                if self._aliases.get(alias) is block:
+                    self._aliases[alias] = component
+
+            components.append(component)
+        return components
+
     def validChecksum(self):
         if len(self.checksum) == 0:
             return False
@@ -426,17 +966,43 @@ class SchLib(object):
 
 
     def getComponentByName(self, name):
-        for component in self.components:
-            if component.definition['name'] == name:
-                return component
+        component = self._names.get(name)
+        if type(component) == _ComponentBlock:
+            component = self.__load([component.index])[0]
+        return component
+
+    def getComponent(self, index):
+        """
+        Return the component at the given position of the library (in file
+        order, see keys). Unlike the lookups by name, this also reaches
+        the components whose name is used by an earlier component
+        """
+        component = self._components[index]
+        if type(component) == _ComponentBlock:
+            component = self.__load([index])[0]
+        return component
+
 
-        return None
+    def getFingerprint(self, index):
+        """
+        Return the fingerprint of the component at the given position (see
+        getComponent and Component.getFingerprint), without parsing it in
+        a lazy library
+        """
+        component = self._components[index]
+        if type(component) == Component:
+            return component.getFingerprint()
 
+        name = component.name
+        docs = [(name, Component.getDocumentation(self.documentation, name))]
+        for alias in component.aliases:
+            docs.append((alias, Component.getDocumentation(self.documentation, alias)))
+        return _fingerprint(component.checksum, docs)
 
     def getComponentCount(self, unique=False):
         count = 0
 
-        for cmp in self.components:
+        for cmp in self._components:
             count += 1
 
             if unique:
@@ -452,107 +1018,179 @@ class SchLib(object):
         for alias in component.aliases.keys():
             self.documentation.remove(alias)
         self.documentation.remove(name)
-        self.components.remove(component)
+        self._components.remove(component)
+        self.__reindex()
         return component
 
     def addComponent(self, component):
-        if not component in self.components:
-            self.components.append(component)
+        # the list is only searched if the name is already used
+        if not (component.name in self._names and component in self._components):
+            self._components.append(component)
+            self.__index(component)
             self.documentation.add(component.name, component.documentation)
             for alias in component.aliases.keys():
                 self.documentation.add(alias, component.aliases[alias])
 
     def save(self, filename=None):
+        """
+        Write the library (and its documentation)
+
+        Components which were not modified (see Component.changed) are
+        written from their lines in the library file. The file is replaced
+        atomically, and is not written at all if its content is unchanged.
+        """
         if not self.validFile: return False
 
         if not filename: filename = self.filename
 
         self.documentation.save(self.libToDcmFilename(filename))
 
-        # insert the header
-        to_write = self.header
+        # text of the components which were never parsed (lazy mode),
+        # read before the file gets replaced
+        blocks = [c for c in self._components if type(c) == _ComponentBlock]
+        unparsed = dict(zip(blocks, self.__readBlocks(blocks))) if blocks else {}
+
+        # byte range of the unparsed components in the new file
+        offsets = {}
+
+        def chunks():
+            # insert the header
+            offset = 0
+            for line in self.header:
+                offset += len(line.encode('utf-8'))
+                yield line
+
+            # Ensure that the components are sorted by name!
+            for component in sorted(self._components, key = lambda cmp: cmp.name):
+                if component in unparsed:
+                    text = unparsed[component]
+                elif component.isModified():
+                    text = ''.join(self.__componentLines(component))
+                else:
+                    text = component._source
+
+                size = len(text.encode('utf-8'))
+                if component in unparsed:
+                    offsets[component] = (offset, offset + size)
+                offset += size
+                yield text
 
-        # Ensure that the components are sorted by name!
-        components = sorted(self.components, key = lambda cmp: cmp.name)
+            # insert the footer
+            yield '#\n'
+            yield '#End Library\n'
 
-        # insert the components
-        for component in components:
-            # append the component comments
-            to_write += component.comments
+        _writeFile(filename, chunks())
 
-            # DEF
-            line = 'DEF '
-            for key in Component._DEF_KEYS:
-                line += component.definition[key] + ' '
+        # the unparsed components are read from the new file from now on
+        if os.path.realpath(filename) == os.path.realpath(self.filename):
+            for block, (start, end) in offsets.items():
+                block.start = start
+                block.end = end
 
-            line = line.rstrip() + '\n'
-            to_write.append(line)
+    def __componentLines(self, component):
+        # the component comments
+        lines = list(component.comments)
 
-            # FIELDS
-            line = 'F'
-            for i, f in enumerate(component.fields):
-                line = "F{n} ".format(n=i)
+        # DEF
+        line = 'DEF '
+        for key in Component._DEF_KEYS:
+            line += component.definition[key] + ' '
 
-                if i == 0:
-                    keys_list = Component._F0_KEYS
-                else:
-                    keys_list = Component._FN_KEYS
+        line = line.rstrip() + '\n'
+        lines.append(line)
 
-                for k, key in enumerate(keys_list):
-                    key_val = component.fields[i][key]
+        # FIELDS
+        line = 'F'
+        for i, f in enumerate(component.fields):
+            line = "F{n} ".format(n=i)
 
-                    if k == 0 and not key_val.startswith('"'):
-                        key_val = '"' + key_val + '"'
+            if i == 0:
+                keys_list = Component._F0_KEYS
+            else:
+                keys_list = Component._FN_KEYS
 
-                    line += key_val + ' '
+            for k, key in enumerate(keys_list):
+                key_val = component.fields[i][key]
 
-                line = line.rstrip() + '\n'
-                to_write.append(line)
+                if k == 0 and not key_val.startswith('"'):
+                    key_val = '"' + key_val + '"'
 
-            # ALIAS
-            if len(component.aliases) > 0:
-                line = 'ALIAS '
-                for alias in component.aliases.keys():
-                    line += alias + ' '
+                line += key_val + ' '
 
-                line = line.rstrip() + '\n'
-                to_write.append(line)
+            line = line.rstrip() + '\n'
+            lines.append(line)
 
-            # $FPLIST
-            if len(component.fplist) > 0:
-                to_write.append('$FPLIST\n')
-                for fp in component.fplist:
-                    to_write.append(' ' + fp + '\n')
+        # ALIAS
+        if len(component.aliases) > 0:
+            line = 'ALIAS '
+            for alias in component.aliases.keys():
+                line += alias + ' '
 
-            # $ENDFPLIST
-                to_write.append('$ENDFPLIST\n')
+            line = line.rstrip() + '\n'
+            lines.append(line)
+
+        # $FPLIST
+        if len(component.fplist) > 0:
+            lines.append('$FPLIST\n')
+            for fp in component.fplist:
+                lines.append(' ' + fp + '\n')
+
+        # $ENDFPLIST
+            lines.append('$ENDFPLIST\n')
+
+        # DRAW
+        lines.append('DRAW\n')
+        for elem in component.drawOrdered:
+            item=elem[1]
+            keys_list = Component._DRAW_KEYS[elem[0]]# 'A' -> keys of all properties of arc
+            line = elem[0] + ' '# 'arcs' -> 'A'
+            for k in keys_list:
+                if k == 'points':
+                    for i in item['points']:
+                        line += '{0} '.format(i)
+                else:
+                    line += item[k] + ' '
 
-            # DRAW
-            to_write.append('DRAW\n')
-            for elem in component.drawOrdered:
-                item=elem[1]
-                keys_list = Component._DRAW_KEYS[elem[0]]# 'A' -> keys of all properties of arc
-                line = elem[0] + ' '# 'arcs' -> 'A'
-                for k in keys_list:
-                    if k == 'points':
-                        for i in item['points']:
-                            line += '{0} '.format(i)
-                    else:
-                        line += item[k] + ' '
+            line = line.rstrip() + '\n'
+            lines.append(line)
 
-                line = line.rstrip() + '\n'
-                to_write.append(line)
+        # ENDDRAW
+        lines.append('ENDDRAW\n')
 
-            # ENDDRAW
-            to_write.append('ENDDRAW\n')
+        # ENDDEF
+        lines.append('ENDDEF\n')
 
-            # ENDDEF
-            to_write.append('ENDDEF\n')
+        return lines
 
-        # insert the footer
-        to_write.append('#\n')
-        to_write.append('#End Library\n')
+def _loadLibrary(filename, lazy):
+    # load a library in a worker process of load_libraries
+    try:
+        return SchLib(filename, lazy=lazy), None
+    except Exception as e:
+        return None, '{type}: {msg}'.format(type=type(e).__name__, msg=e)
 
-        f = open(filename, 'w', newline='\n')
-        f.writelines(to_write)
-        f.close()
+def load_libraries(filenames, jobs=None, lazy=False):
+    """
+    Load several libraries, in jobs worker processes (one per CPU by
+    default). Return the SchLib objects in the order of filenames; a
+    library which could not be loaded is reported on stderr and is None
+    in the list.
+    """
+    filenames = list(filenames)
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(filenames))
+
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(_loadLibrary, filenames, [lazy] * len(filenames)))
+    else:
+        results = [_loadLibrary(filename, lazy) for filename in filenames]
+
+    libraries = []
+    for filename, (lib, error) in zip(filenames, results):
+        if error:
+            sys.stderr.write("Could not load '{filename}': {error}\n".format(filename=filename, error=error))
+        libraries.append(lib)
+    return libraries